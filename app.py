@@ -1,16 +1,31 @@
 import os
 import sys
 import uuid
+import base64
+import hashlib
+import binascii
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.datastructures import MultiDict
 import threading
 import time
-import pandas as pd
+import queue
 
 # 导入原有的分析函数
-from prompt_generate import analyze_single_image, translate_to_english, DEFAULT_MODELS
+from prompt_generate import (analyze_single_image, translate_to_english, split_bilingual_result,
+                             DEFAULT_MODELS, BILINGUAL_INSTRUCTION)
+from file_janitor import FileJanitor
+from task_store import TaskStore
+from upload_ingest import iter_multipart, read_multipart, persist_bytes, resolve_source_path
+from result_export import EXPORT_FORMATS, iter_export, write_xlsx
+from request_scheduler import scheduling, get_scheduler, PRIORITY_INTERACTIVE
+from progress_stats import ProgressTracker, get_latency_stats
+from pdf_source import file_sha256
+from task_callback import deliver_callback, validate_callback_url
+from result_store import result_to_record, archive_results, get_result_store
+from token_budget import get_token_budget
 
 # 设置与原始文件相同的环境变量和配置
 os.environ["OPENAI_API_KEY"] = "35f54cc4-be7a-4414-808e-f5f9f0194d4f"
@@ -24,17 +39,42 @@ app.secret_key = 'your-secret-key-here'  # 用于flash消息
 
 # 配置
 UPLOAD_FOLDER = 'uploads'
-MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+MAX_FILE_SIZE = 16 * 1024 * 1024  # 单个文件16MB
+MAX_UPLOAD_SIZE = 1024 * 1024 * 1024  # 单次上传总计1GB
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
+FILE_TTL = 3600  # 上传文件和Excel文件保留1小时
+TASK_SPILL_FOLDER = os.path.join(UPLOAD_FOLDER, 'tasks')
+MAX_TASKS_IN_MEMORY = 200  # 内存中最多保留的任务数
+TASK_MEMORY_TTL = 1800  # 已结束任务在内存中保留30分钟，之后写盘
+TASK_SPILL_TTL = 24 * 3600  # 写盘的任务保留1天
+# JSON接口允许按服务器本地路径提交图片的根目录，未设置时不接受路径
+API_PATH_ROOT = os.environ.get('PROMPT_API_PATH_ROOT')
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+app.config['MAX_FILE_SIZE'] = MAX_FILE_SIZE
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
+app.config['API_PATH_ROOT'] = API_PATH_ROOT
 
 # 确保上传目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(TASK_SPILL_FOLDER, exist_ok=True)
 
-# 存储分析任务的状态
-task_status = {}
+# 后台清理线程：按TTL索引删除过期文件，不在请求路径上扫描目录
+janitor = FileJanitor(ttl=FILE_TTL)
+janitor.seed(UPLOAD_FOLDER)
+janitor.seed(TASK_SPILL_FOLDER, ttl=TASK_SPILL_TTL)
+janitor.start()
+
+# 存储分析任务的状态（已结束的任务按LRU写盘，访问时再加载）
+task_status = TaskStore(
+    TASK_SPILL_FOLDER,
+    max_tasks=MAX_TASKS_IN_MEMORY,
+    max_age=TASK_MEMORY_TTL,
+    on_spill=lambda path: janitor.track(path, ttl=TASK_SPILL_TTL)
+)
+
+# 进行中任务的进度跟踪器（结束后最终进度写入任务状态）
+task_progress = {}
 
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
@@ -42,46 +82,88 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def cleanup_old_files():
-    """清理旧的上传文件（超过1小时的文件）"""
-    try:
-        current_time = time.time()
-        for filename in os.listdir(UPLOAD_FOLDER):
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            if os.path.isfile(file_path):
-                file_age = current_time - os.path.getctime(file_path)
-                if file_age > 3600:  # 1小时
-                    os.remove(file_path)
-                    print(f"已清理旧文件: {filename}")
-    except Exception as e:
-        print(f"清理文件时出错: {str(e)}")
+    """立即清理已过期的上传文件（超过1小时的文件）"""
+    return janitor.sweep()
 
-def analyze_images_async(files_info, task_id, custom_prompt, selected_models=None):
-    """异步分析多张图片并生成Excel"""
+def analyze_images_async(file_source, task_id, custom_prompt, selected_models=None, bilingual=False):
+    """
+    异步分析多张图片并生成Excel
+
+    file_source可以是文件信息列表，也可以是以None结尾的queue.Queue，
+    后者用于上传过程中边接收边分析。
+    bilingual为True时模型一次返回中文分析和英文prompt，不再单独翻译。
+    """
+    # Web任务的模型请求按交互优先级调度，优先于命令行批量任务
+    tenant = task_status[task_id].get('tenant') or f"task:{task_id}"
+    with scheduling(PRIORITY_INTERACTIVE, tenant):
+        _analyze_images(file_source, task_id, custom_prompt, selected_models, bilingual)
+    
+    # 任务结束后通知回调地址（提交时未指定则跳过）
+    callback_url = task_status[task_id].get('callback_url')
+    if callback_url:
+        payload = dict(task_summary(task_id), task_id=task_id, links=task_status[task_id].get('links'))
+        task_status[task_id]['callback'] = {'status': 'pending', 'attempts': 0}
+        task_status[task_id]['callback'] = deliver_callback(callback_url, payload, task_id=task_id)
+
+def _analyze_images(file_source, task_id, custom_prompt, selected_models, bilingual):
+    """analyze_images_async的主体（在调度上下文中运行）"""
+    files_info = []
+    # 如果没有指定模型，使用默认的所有模型
+    models_to_use = selected_models if selected_models else DEFAULT_MODELS
+    tracker = ProgressTracker(task_status[task_id].get('total', 0), models_to_use, translate=not bilingual)
+    task_progress[task_id] = tracker
     try:
         # 更新状态为处理中
         task_status[task_id]['status'] = 'processing'
         task_status[task_id]['progress'] = 0
         
         results = []
-        total_files = len(files_info)
+        results_by_hash = {}  # 内容哈希 -> 该图片的分析结果，用于重复图片
+        archive_records = []  # 写入历史结果存储的行
+        base_prompt = custom_prompt if custom_prompt else DEFAULT_PROMPT
+        if isinstance(file_source, queue.Queue):
+            file_iter = iter(file_source.get, None)
+        else:
+            file_iter = iter(file_source)
         
         # 逐个分析图片
-        for i, file_info in enumerate(files_info):
+        for i, file_info in enumerate(file_iter):
+            files_info.append(file_info)
+            if task_status[task_id].get('cancelled'):
+                # 上传中断，剩余文件不再分析，只收集起来清理
+                continue
+            # 上传仍在进行时总数随文件到达增加
+            tracker.total = task_status[task_id].get('total', 0)
             try:
+                if file_info.get('duplicate_of'):
+                    # 内容相同的图片只分析一次，直接复用结果
+                    for result in results_by_hash.get(file_info['duplicate_of'], []):
+                        results.append(dict(result, original_filename=file_info['original_name']))
+                        archive_records.append(result_to_record(results[-1], file_info['sha256'], base_prompt))
+                    tracker.image_done([r['model'] for r in results_by_hash.get(file_info['duplicate_of'], [])])
+                    task_status[task_id]['progress'] = i + 1
+                    task_status[task_id]['results'] = results
+                    continue
+                
+                image_results = []
                 print(f"正在分析图片: {file_info['filename']}")
                 # analyze_single_image返回的是model_analysis_pairs列表
                 # 如果没有自定义提示词，使用默认提示词
-                prompt_to_use = custom_prompt if custom_prompt else DEFAULT_PROMPT
-                # 如果没有指定模型，使用默认的所有模型
-                models_to_use = selected_models if selected_models else DEFAULT_MODELS
+                prompt_to_use = base_prompt
+                if bilingual:
+                    prompt_to_use += BILINGUAL_INSTRUCTION
                 model_analysis_pairs = analyze_single_image(file_info['filepath'], prompt_to_use, models_to_use)
                 
                 if model_analysis_pairs and len(model_analysis_pairs) > 0:
                     # 保留所有模型的分析结果
                     for model_name, analysis_content in model_analysis_pairs:
                         if analysis_content and not analysis_content.startswith("分析失败"):
-                            # 翻译为英文
-                            english_result = translate_to_english(analysis_content)
+                            if bilingual:
+                                # 双语模式：直接拆出中文分析和英文prompt
+                                analysis_content, english_result = split_bilingual_result(analysis_content)
+                            else:
+                                # 翻译为英文
+                                english_result = translate_to_english(analysis_content)
                             
                             result = {
                                 'filename': file_info['filename'],
@@ -91,43 +173,38 @@ def analyze_images_async(files_info, task_id, custom_prompt, selected_models=Non
                                 'english_analysis': english_result
                             }
                             results.append(result)
+                            image_results.append(result)
                             # 移除break，保留所有成功的模型结果
                 
+                if file_info.get('sha256'):
+                    results_by_hash[file_info['sha256']] = image_results
+                archive_records.extend(result_to_record(result, file_info.get('sha256'), base_prompt)
+                                       for result in image_results)
+                
                 # 更新进度
+                tracker.image_done([r['model'] for r in image_results])
                 task_status[task_id]['progress'] = i + 1
                 task_status[task_id]['results'] = results
                 
             except Exception as e:
+                tracker.image_done()
                 print(f"分析图片 {file_info['original_name']} 时出错: {str(e)}")
                 continue
         
-        if results:
+        # 追加到历史结果存储，供跨任务搜索
+        archive_results(archive_records)
+        
+        if task_status[task_id].get('cancelled'):
+            task_status[task_id]['status'] = 'failed'
+        elif results:
             # 生成Excel文件
             excel_filename = f"analysis_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
             excel_path = os.path.join(app.config['UPLOAD_FOLDER'], excel_filename)
             
-            # 创建Excel数据
-            excel_data = []
-            for result in results:
-                excel_data.append({
-                    '图片名': result.get('original_filename', result.get('filename', '')),
-                    '模型名': result.get('model', ''),
-                    '分析内容': result.get('analysis', ''),
-                    '英文prompt': result.get('english_analysis', '')
-                })
-            
-            # 保存为Excel
-            df = pd.DataFrame(excel_data)
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='分析结果')
-                
-                # 设置列宽
-                worksheet = writer.sheets['分析结果']
-                worksheet.column_dimensions['A'].width = 30
-                worksheet.column_dimensions['B'].width = 15
-                worksheet.column_dimensions['C'].width = 50
-                worksheet.column_dimensions['D'].width = 50
+            # 逐行写出Excel（只写模式，不构建DataFrame）
+            write_xlsx(results, excel_path)
             
+            janitor.track(excel_path)
             task_status[task_id]['excel_file'] = excel_filename
             task_status[task_id]['status'] = 'completed'
         else:
@@ -139,110 +216,339 @@ def analyze_images_async(files_info, task_id, custom_prompt, selected_models=Non
         task_status[task_id]['status'] = 'failed'
     
     finally:
-        # 清理上传的文件
+        # 保存最终进度、模型耗时和输出长度统计
+        task_status[task_id]['progress_stats'] = tracker.snapshot()
+        task_progress.pop(task_id, None)
+        get_latency_stats().save()
+        get_token_budget().save()
+        
+        # 清理上传的文件（按路径提交的服务器本地文件不删除）
         for file_info in files_info:
             try:
-                if os.path.exists(file_info['filepath']):
+                if file_info.get('external'):
+                    continue
+                if file_info.get('filepath') and os.path.exists(file_info['filepath']):
                     os.remove(file_info['filepath'])
+                    janitor.forget(file_info['filepath'])
             except:
                 pass
 
+def duplicate_file_info(original_name, sha256, size):
+    """与已接收文件内容相同的文件，不落盘，分析时复用结果"""
+    return {
+        'filepath': None,
+        'filename': secure_filename(original_name),
+        'original_name': original_name,
+        'sha256': sha256,
+        'size': size,
+        'duplicate_of': sha256
+    }
+
 @app.route('/')
 def index():
     """主页 - 显示上传界面"""
     return render_template('index.html')
 
+def _start_upload_task(fields, saved_files):
+    """按表单字段创建上传任务并启动分析线程，返回(任务ID, 文件队列)"""
+    # 获取自定义提示词
+    custom_prompt = fields.get('prompt', '').strip()
+    
+    # 获取用户选择的模型列表
+    selected_models = fields.getlist('models')
+    if not selected_models:
+        # 如果没有选择任何模型，使用默认的所有模型
+        selected_models = DEFAULT_MODELS
+    
+    # 是否使用双语模式（一次请求生成中文分析和英文prompt）
+    bilingual = fields.get('bilingual') == 'on'
+    
+    # 生成任务ID
+    task_id = str(uuid.uuid4())
+    
+    # 初始化任务状态（total随文件到达更新）
+    task_status[task_id] = {
+        'status': 'processing',
+        'progress': 0,
+        'total': len(saved_files),
+        'results': [],
+        'error': None,
+        'start_time': datetime.now(),
+        'files': saved_files,
+        'excel_file': None,
+        'selected_models': selected_models,
+        'bilingual': bilingual,
+        'tenant': f"web:{request.remote_addr}"
+    }
+    
+    file_queue = queue.Queue()
+    for file_info in saved_files:
+        file_queue.put(file_info)
+    thread = threading.Thread(
+        target=analyze_images_async, 
+        args=(file_queue, task_id, custom_prompt, selected_models, bilingual)
+    )
+    thread.daemon = True
+    thread.start()
+    return task_id, file_queue
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """处理文件上传"""
+    """
+    处理文件上传
+    
+    边接收边解析请求体，每个文件收到后直接落盘。表单字段在文件之前到达时（首页脚本按此顺序提交），
+    第一个文件落盘后即启动分析线程，之后的文件到达一个分析一个；字段在文件之后到达时，
+    接收完整个请求体后再开始分析。
+    """
+    fields = MultiDict()
+    saved_files = []
+    seen_hashes = set()
+    task_id = None
+    file_queue = None
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
     try:
-        if 'files' not in request.files:
-            flash('没有选择文件', 'error')
-            return redirect(url_for('index'))
-        
-        files = request.files.getlist('files')
-        if not files or all(f.filename == '' for f in files):
-            flash('没有选择文件', 'error')
-            return redirect(url_for('index'))
-        
-        # 过滤有效文件
-        valid_files = [f for f in files if f and f.filename != '' and allowed_file(f.filename)]
+        for kind, name, value in iter_multipart(request, app.config['UPLOAD_FOLDER'], timestamp,
+                                                max_file_size=app.config['MAX_FILE_SIZE'], accept=allowed_file):
+            if kind == 'field':
+                fields.add(name, value)
+                continue
+            if kind != 'file':
+                continue
+            if name != 'files':
+                os.remove(value['filepath'])
+                continue
+            
+            # 内容相同的文件只保留一份，分析时复用结果
+            if value['sha256'] in seen_hashes:
+                os.remove(value['filepath'])
+                file_info = duplicate_file_info(value['original_name'], value['sha256'], value['size'])
+            else:
+                seen_hashes.add(value['sha256'])
+                file_info = value
+            saved_files.append(file_info)
+            
+            if file_queue is None and fields:
+                task_id, file_queue = _start_upload_task(fields, saved_files)
+            elif file_queue is not None:
+                task_status[task_id]['total'] = len(saved_files)
+                file_queue.put(file_info)
         
-        if not valid_files:
+        if not saved_files:
             flash('没有有效的图片文件', 'error')
             return redirect(url_for('index'))
         
-        if len(valid_files) > 10:
-            flash('最多只能同时上传10张图片', 'error')
-            return redirect(url_for('index'))
-        
-        # 检查文件大小
-        for file in valid_files:
-            file.seek(0, 2)
-            file_size = file.tell()
-            file.seek(0)
-            
-            if file_size > app.config['MAX_CONTENT_LENGTH']:
-                flash(f'文件 "{file.filename}" 太大，请选择小于16MB的文件', 'error')
-                return redirect(url_for('index'))
-        
-        # 清理旧文件
-        cleanup_old_files()
-        
-        # 保存所有文件
-        saved_files = []
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        for i, file in enumerate(valid_files):
-            filename = secure_filename(file.filename)
-            filename = f"{timestamp}_{i+1:02d}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            saved_files.append({
-                'filepath': filepath,
-                'filename': filename,
-                'original_name': file.filename
-            })
-        
-        # 获取自定义提示词
-        custom_prompt = request.form.get('prompt', '').strip()
-        
-        # 获取用户选择的模型列表
-        selected_models = request.form.getlist('models')
-        if not selected_models:
-            # 如果没有选择任何模型，使用默认的所有模型
-            selected_models = DEFAULT_MODELS
-        
-        # 生成任务ID
-        task_id = str(uuid.uuid4())
-        
-        # 初始化任务状态
-        task_status[task_id] = {
-            'status': 'processing',
-            'progress': 0,
-            'total': len(saved_files),
-            'results': [],
-            'error': None,
-            'start_time': datetime.now(),
-            'files': saved_files,
-            'excel_file': None,
-            'selected_models': selected_models
-        }
-        
-        # 启动异步分析任务
-        thread = threading.Thread(
-            target=analyze_images_async, 
-            args=(saved_files, task_id, custom_prompt, selected_models)
-        )
-        thread.daemon = True
-        thread.start()
+        if file_queue is None:
+            task_id, file_queue = _start_upload_task(fields, saved_files)
+        task_status[task_id]['total'] = len(saved_files)
+        file_queue.put(None)
         
         return redirect(url_for('result', task_id=task_id))
     
     except Exception as e:
+        if file_queue is not None:
+            # 上传中断：通知分析线程停止，已落盘的文件由分析线程清理
+            task_status[task_id]['cancelled'] = True
+            task_status[task_id]['error'] = '上传中断'
+            file_queue.put(None)
+        else:
+            for file_info in saved_files:
+                if file_info.get('filepath') and os.path.exists(file_info['filepath']):
+                    os.remove(file_info['filepath'])
+        if isinstance(e, RequestEntityTooLarge):
+            raise
         flash(f'上传失败: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+def _read_api_submission():
+    """
+    读取JSON接口提交的任务参数
+
+    支持两种请求体：
+    - application/json: {"prompt", "models", "bilingual", "callback_url",
+      "files": [{"name", "content"(base64)}], "paths": [...]}
+    - multipart/form-data: files文件字段，paths/models可重复，其余为普通字段
+
+    Returns:
+        tuple: (参数dict, 错误信息)
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return None, 'Request body must be a JSON object'
+        models = data.get('models') or []
+        paths = data.get('paths') or []
+        encoded_files = data.get('files') or []
+        if isinstance(models, str):
+            models = [models]
+        if not isinstance(models, list) or not isinstance(paths, list) or not isinstance(encoded_files, list):
+            return None, 'models, paths and files must be lists'
+        bilingual = data.get('bilingual', False)
+        submission = {
+            'prompt': str(data.get('prompt') or '').strip(),
+            'models': [str(m) for m in models],
+            'bilingual': bilingual if isinstance(bilingual, bool) else str(bilingual).lower() in ('1', 'true', 'on', 'yes'),
+            'callback_url': data.get('callback_url'),
+            'paths': [str(p) for p in paths],
+            'uploads': [],
+            'encoded': encoded_files
+        }
+    else:
+        # 上传的文件在解析请求体时直接落盘
+        form, uploads, skipped = read_multipart(request, app.config['UPLOAD_FOLDER'],
+                                                datetime.now().strftime('%Y%m%d_%H%M%S'),
+                                                max_file_size=app.config['MAX_FILE_SIZE'], accept=allowed_file)
+        submission = {
+            'prompt': form.get('prompt', '').strip(),
+            'models': form.getlist('models'),
+            'bilingual': form.get('bilingual', 'false').lower() in ('1', 'true', 'on', 'yes'),
+            'callback_url': form.get('callback_url'),
+            'paths': form.getlist('paths'),
+            'uploads': uploads,
+            'encoded': []
+        }
+        if skipped:
+            _remove_uploads(uploads)
+            return None, f'Unsupported file type: {skipped[0]}'
+    
+    error = None
+    if submission['callback_url']:
+        error = validate_callback_url(submission['callback_url'])
+    if not error and submission['paths'] and not app.config.get('API_PATH_ROOT'):
+        error = 'Submitting server paths is disabled (PROMPT_API_PATH_ROOT is not set)'
+    if not error and not (submission['paths'] or submission['uploads'] or submission['encoded']):
+        error = 'No files or paths submitted'
+    if error:
+        _remove_uploads(submission['uploads'])
+        return None, error
+    return submission, None
+
+def _remove_uploads(files_info):
+    """删除本次请求已落盘的文件（按路径提交的服务器本地文件除外）"""
+    for file_info in files_info:
+        if file_info.get('filepath') and not file_info.get('external'):
+            try:
+                os.remove(file_info['filepath'])
+                janitor.forget(file_info['filepath'])
+            except OSError:
+                pass
+
+def _collect_api_files(submission, timestamp):
+    """
+    校验并落盘JSON接口提交的文件，返回文件信息列表
+
+    Raises:
+        ValueError: 文件类型不支持、base64无效、路径不允许等
+    """
+    files_info = []
+    seen_hashes = set()
+    
+    # 上传的文件不登记到janitor：排队时间可能超过TTL，由分析线程结束时删除
+    def add(file_info):
+        seen_hashes.add(file_info['sha256'])
+        files_info.append(file_info)
+    
+    try:
+        for path in submission['paths']:
+            if not allowed_file(path):
+                raise ValueError(f'Unsupported file type: {path}')
+            filepath = resolve_source_path(path, app.config['API_PATH_ROOT'])
+            size = os.path.getsize(filepath)
+            if size > app.config['MAX_FILE_SIZE']:
+                raise ValueError(f'File too large: {path}')
+            sha256 = file_sha256(filepath)
+            if sha256 in seen_hashes:
+                files_info.append(duplicate_file_info(path, sha256, size))
+                continue
+            seen_hashes.add(sha256)
+            files_info.append({
+                'filepath': filepath,
+                'filename': os.path.basename(filepath),
+                'original_name': path,
+                'sha256': sha256,
+                'size': size,
+                'external': True  # 服务器本地文件，分析后不删除
+            })
+        
+        for i, entry in enumerate(submission['encoded']):
+            name = entry.get('name') if isinstance(entry, dict) else None
+            if not name or not allowed_file(name):
+                raise ValueError(f'Unsupported file type: {name}')
+            try:
+                data = base64.b64decode(entry.get('content') or '', validate=True)
+            except (binascii.Error, TypeError):
+                raise ValueError(f'Invalid base64 content: {name}')
+            if len(data) > app.config['MAX_FILE_SIZE']:
+                raise ValueError(f'File too large: {name}')
+            sha256 = hashlib.sha256(data).hexdigest()
+            if sha256 in seen_hashes:
+                files_info.append(duplicate_file_info(name, sha256, len(data)))
+                continue
+            add(persist_bytes(data, name, app.config['UPLOAD_FOLDER'], f"{timestamp}_{i+1:04d}"))
+        
+        # multipart上传的文件已在解析请求体时落盘，这里只去重
+        for file_info in submission['uploads']:
+            if file_info['sha256'] in seen_hashes:
+                os.remove(file_info['filepath'])
+                files_info.append(duplicate_file_info(file_info['original_name'], file_info['sha256'], file_info['size']))
+                continue
+            add(file_info)
+    except ValueError:
+        # 校验失败时删除本次已落盘的文件
+        _remove_uploads(files_info + submission['uploads'])
+        raise
+    return files_info
+
+@app.route('/api/tasks', methods=['POST'])
+def create_task():
+    """
+    以JSON接口提交批量分析任务
+
+    立即返回202和任务ID；提交了callback_url时，任务结束后把结果POST到该地址，
+    调用方无需轮询状态接口。
+    """
+    submission, error = _read_api_submission()
+    if error:
+        return jsonify({'error': error}), 400
+    
+    try:
+        files_info = _collect_api_files(submission, datetime.now().strftime('%Y%m%d_%H%M%S'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    selected_models = submission['models'] or DEFAULT_MODELS
+    task_id = str(uuid.uuid4())
+    links = {
+        'status': url_for('get_status', task_id=task_id, _external=True),
+        'download': url_for('download_excel', task_id=task_id, _external=True),
+        'export': url_for('export_results', task_id=task_id, _external=True)
+    }
+    task_status[task_id] = {
+        'status': 'processing',
+        'progress': 0,
+        'total': len(files_info),
+        'results': [],
+        'error': None,
+        'start_time': datetime.now(),
+        'files': files_info,
+        'excel_file': None,
+        'selected_models': selected_models,
+        'bilingual': submission['bilingual'],
+        'tenant': f"api:{request.remote_addr}",
+        'callback_url': submission['callback_url'],
+        'links': links
+    }
+    
+    thread = threading.Thread(
+        target=analyze_images_async,
+        args=(files_info, task_id, submission['prompt'], selected_models, submission['bilingual'])
+    )
+    thread.daemon = True
+    thread.start()
+    
+    return jsonify({'task_id': task_id, 'status': 'processing', 'total': len(files_info), 'links': links}), 202
+
 @app.route('/result/<task_id>')
 def result(task_id):
     """显示分析结果"""
@@ -253,21 +559,32 @@ def result(task_id):
     task = task_status[task_id]
     return render_template('result.html', task=task, task_id=task_id)
 
-@app.route('/api/status/<task_id>')
-def get_status(task_id):
-    """获取任务状态的API接口"""
-    if task_id not in task_status:
-        return jsonify({'error': 'Task not found'}), 404
-    
+def task_summary(task_id):
+    """任务状态摘要（状态接口和完成回调共用）"""
     task = task_status[task_id]
-    return jsonify({
+    tracker = task_progress.get(task_id)
+    # 进行中的任务实时计算，已结束的任务返回最终进度
+    progress_stats = tracker.snapshot() if tracker else task.get('progress_stats')
+    summary = {
         'status': task['status'],
         'progress': task.get('progress', 0),
         'total': task.get('total', 0),
         'results': task.get('results', []),
         'error': task.get('error', ''),
-        'excel_file': task.get('excel_file', '')
-    })
+        'excel_file': task.get('excel_file', ''),
+        'progress_stats': progress_stats
+    }
+    if task.get('callback'):
+        summary['callback'] = task['callback']
+    return summary
+
+@app.route('/api/status/<task_id>')
+def get_status(task_id):
+    """获取任务状态的API接口"""
+    if task_id not in task_status:
+        return jsonify({'error': 'Task not found'}), 404
+    
+    return jsonify(task_summary(task_id))
 
 @app.route('/download/<task_id>')
 def download_excel(task_id):
@@ -286,12 +603,20 @@ def download_excel(task_id):
     excel_path = os.path.join(app.config['UPLOAD_FOLDER'], excel_file)
     
     if not os.path.exists(excel_path):
-        flash('Excel文件已被删除', 'error')
-        return redirect(url_for('result', task_id=task_id))
+        # Excel按文件TTL清理，落盘的任务保留更久：文件已删除时按任务结果重新生成
+        if not task.get('results'):
+            flash('Excel文件已被删除', 'error')
+            return redirect(url_for('result', task_id=task_id))
+        try:
+            write_xlsx(task['results'], excel_path)
+        except Exception as e:
+            flash(f'重新生成Excel失败: {str(e)}', 'error')
+            return redirect(url_for('result', task_id=task_id))
+        janitor.track(excel_path)
     
     try:
         return send_file(
-            excel_path,
+            os.path.abspath(excel_path),
             as_attachment=True,
             download_name=excel_file,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
@@ -300,6 +625,36 @@ def download_excel(task_id):
         flash(f'下载失败: {str(e)}', 'error')
         return redirect(url_for('result', task_id=task_id))
 
+@app.route('/export/<task_id>')
+def export_results(task_id):
+    """
+    按需导出当前结果（xlsx/csv/jsonl）
+
+    任务未完成时导出已完成部分的快照，不必等待所有图片分析结束。
+    """
+    if task_id not in task_status:
+        return jsonify({'error': 'Task not found'}), 404
+    
+    fmt = request.args.get('format', 'xlsx').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    
+    task = task_status[task_id]
+    # 复制当前结果列表作为快照，分析线程可继续追加
+    snapshot = list(task.get('results') or [])
+    suffix = '' if task.get('status') == 'completed' else '_partial'
+    download_name = f"analysis_results_{task_id[:8]}{suffix}.{fmt}"
+    
+    return Response(
+        stream_with_context(iter_export(snapshot, fmt)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="{download_name}"',
+            'X-Result-Count': str(len(snapshot)),
+            'X-Task-Status': task.get('status', '')
+        }
+    )
+
 @app.route('/cleanup')
 def cleanup():
     """手动清理旧文件"""
@@ -307,8 +662,67 @@ def cleanup():
     flash('已清理旧文件')
     return redirect(url_for('index'))
 
+@app.route('/api/janitor/stats')
+def janitor_stats():
+    """获取后台清理线程统计信息的API接口"""
+    return jsonify(janitor.stats())
+
+@app.route('/api/tasks/stats')
+def task_stats():
+    """获取任务状态表统计信息的API接口"""
+    return jsonify(task_status.stats())
+
+@app.route('/api/models/stats')
+def model_stats():
+    """获取各模型历史耗时统计的API接口"""
+    return jsonify(get_latency_stats().summary())
+
+@app.route('/api/tokens/stats')
+def token_stats():
+    """获取各模型/提示词输出长度和截断率统计的API接口"""
+    return jsonify(get_token_budget().summary())
+
+@app.route('/api/search')
+def search_results():
+    """
+    搜索历史分析结果
+
+    参数: q查询词（空格分隔，需全部出现），model只搜索该模型，limit最多返回条数
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query parameter: q'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    start = time.perf_counter()
+    records = get_result_store().search(query, model=request.args.get('model') or None, limit=limit)
+    return jsonify({
+        'query': query,
+        'count': len(records),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+        'results': records
+    })
+
+@app.route('/api/search/stats')
+def search_stats():
+    """获取历史结果存储统计信息的API接口"""
+    return jsonify(get_result_store().stats())
+
+@app.route('/api/scheduler/stats')
+def scheduler_stats():
+    """获取请求调度器排队情况的API接口"""
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(scheduler.stats(), enabled=True))
+
 @app.errorhandler(413)
 def too_large(e):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'File too large'}), 413
     flash('文件太大。请上传小于16MB的文件。')
     return redirect(url_for('index'))
 
@@ -0,0 +1,93 @@
+"""
+冷启动时间基准
+
+分别在全新的Python进程中测量：
+  1. python prompt_generate.py --help
+  2. 导入Web应用模块（创建Flask app并注册路由）
+
+并检查这两条路径没有提前导入pandas、PyPDF2、PIL、openpyxl、openai等重依赖。
+任一项超出预算时以非零状态退出，可直接放进CI。
+
+用法:
+    python bench_import_time.py [--runs 5] [--cli-budget 0.4] [--app-budget 0.6]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ['pandas', 'numpy', 'PyPDF2', 'PIL', 'openpyxl', 'openai', 'httpx']
+
+LEAK_CHECK = (
+    "import sys; import {module}; "
+    "print(','.join(m for m in {heavy!r} if m in sys.modules))"
+)
+
+
+def run_timed(cmd, cwd, env):
+    """运行一次命令，返回(耗时秒数, 标准输出)"""
+    start = time.perf_counter()
+    completed = subprocess.run(cmd, cwd=cwd, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"命令执行失败: {' '.join(cmd)}\n{completed.stderr}")
+    return elapsed, completed.stdout
+
+
+def measure(name, cmd, runs, budget, cwd, env):
+    """多次运行取中位数，并与预算比较"""
+    timings = [run_timed(cmd, cwd, env)[0] for _ in range(runs)]
+    median = statistics.median(timings)
+    ok = median <= budget
+    print(f"{name:<28} 中位数 {median:.3f}s  最小 {min(timings):.3f}s  预算 {budget:.2f}s  {'OK' if ok else '超出预算'}")
+    return ok
+
+
+def check_heavy_imports(module, cwd, env):
+    """检查导入模块后是否加载了重依赖"""
+    _, output = run_timed([sys.executable, "-c", LEAK_CHECK.format(module=module, heavy=HEAVY_MODULES)], cwd, env)
+    leaked = [m for m in output.strip().split(',') if m]
+    if leaked:
+        print(f"{module} 导入时加载了重依赖: {', '.join(leaked)}")
+    else:
+        print(f"{module} 导入时未加载重依赖")
+    return not leaked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量命令行和Web应用的冷启动时间")
+    parser.add_argument("--runs", type=int, default=5, help="每项运行次数")
+    parser.add_argument("--cli-budget", type=float, default=0.4, help="prompt_generate.py --help 的预算（秒）")
+    parser.add_argument("--app-budget", type=float, default=0.6, help="Web应用导入的预算（秒）")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT_DIR + os.pathsep + env.get("PYTHONPATH", "")
+
+    # 在临时目录中运行，避免Web应用在仓库里创建uploads目录
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 先各运行一次预热文件系统缓存和字节码
+        run_timed([sys.executable, os.path.join(ROOT_DIR, "prompt_generate.py"), "--help"], work_dir, env)
+        run_timed([sys.executable, "-c", "import app"], work_dir, env)
+
+        results = [
+            measure("prompt_generate.py --help",
+                    [sys.executable, os.path.join(ROOT_DIR, "prompt_generate.py"), "--help"],
+                    args.runs, args.cli_budget, work_dir, env),
+            measure("import app (Flask应用)",
+                    [sys.executable, "-c", "import app"],
+                    args.runs, args.app_budget, work_dir, env),
+            check_heavy_imports("prompt_generate", work_dir, env),
+            check_heavy_imports("app", work_dir, env)
+        ]
+
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import os
+import heapq
+import threading
+import time
+
+
+class FileJanitor:
+    """
+    后台文件清理线程
+
+    维护一个按过期时间排序的小顶堆（TTL索引），记录生成的Excel文件和落盘的任务。
+    上传的图片在任务结束时由分析线程删除，不在接收时登记（长任务排队的图片可能超过TTL）；
+    进程重启前遗留的文件由启动时的seed扫描登记。
+    清理线程按计划删除过期文件，请求路径上不再需要扫描整个上传目录。
+    """
+
+    def __init__(self, ttl=3600, interval=60):
+        """
+        Args:
+            ttl: 文件默认保留时间（秒）
+            interval: 清理线程最长休眠时间（秒）
+        """
+        self.ttl = ttl
+        self.interval = interval
+        self._heap = []          # (过期时间, 文件路径)
+        self._expiry = {}        # 文件路径 -> 当前有效的过期时间
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._removed = 0
+        self._errors = 0
+        self._last_sweep = None
+
+    def track(self, path, ttl=None):
+        """登记一个文件，在ttl秒后删除（重复登记会刷新过期时间）"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._expiry[path] = expires_at
+            heapq.heappush(self._heap, (expires_at, path))
+            is_earliest = self._heap[0][1] == path
+        if is_earliest:
+            self._wakeup.set()
+
+    def forget(self, path):
+        """取消登记（文件已被其他逻辑删除时调用）"""
+        with self._lock:
+            self._expiry.pop(path, None)
+
+    def seed(self, directory, ttl=None):
+        """启动时扫描一次目录，把已有文件按创建时间加入索引"""
+        if ttl is None:
+            ttl = self.ttl
+        try:
+            for filename in os.listdir(directory):
+                file_path = os.path.join(directory, filename)
+                if os.path.isfile(file_path):
+                    remaining = ttl - (time.time() - os.path.getctime(file_path))
+                    self.track(file_path, ttl=max(remaining, 0))
+        except Exception as e:
+            print(f"扫描目录 {directory} 时出错: {str(e)}")
+
+    def sweep(self, now=None):
+        """删除所有已过期的文件，返回删除数量"""
+        if now is None:
+            now = time.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, path = heapq.heappop(self._heap)
+                # 堆中可能残留被刷新或取消的旧记录，只处理当前有效的那一条
+                if self._expiry.get(path) == expires_at:
+                    del self._expiry[path]
+                    due.append(path)
+            self._last_sweep = now
+
+        removed = 0
+        for path in due:
+            try:
+                if os.path.isfile(path):
+                    os.remove(path)
+                    removed += 1
+                    print(f"已清理旧文件: {os.path.basename(path)}")
+            except Exception as e:
+                self._errors += 1
+                print(f"清理文件时出错: {str(e)}")
+
+        with self._lock:
+            self._removed += removed
+        return removed
+
+    def _next_delay(self):
+        with self._lock:
+            if not self._heap:
+                return self.interval
+            delay = self._heap[0][0] - time.time()
+        return min(max(delay, 0), self.interval)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self._next_delay())
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            self.sweep()
+
+    def start(self):
+        """启动后台清理线程（重复调用无副作用）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='file-janitor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """停止后台清理线程"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self):
+        """返回清理线程的运行统计"""
+        with self._lock:
+            next_expiry = min(self._expiry.values()) if self._expiry else None
+            return {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'tracked_files': len(self._expiry),
+                'heap_size': len(self._heap),
+                'removed_files': self._removed,
+                'errors': self._errors,
+                'ttl': self.ttl,
+                'next_expiry_in': max(next_expiry - time.time(), 0) if next_expiry else None,
+                'last_sweep': self._last_sweep
+            }
@@ -0,0 +1,91 @@
+import time
+import threading
+
+import httpx
+
+from replay_transport import cassette_config, create_transport
+from request_scheduler import current_scheduling, get_scheduler
+
+
+MAX_RETRIES = 2           # 与OpenAI客户端默认的重试次数相同
+RETRY_BACKOFF = 0.5       # 首次重试等待秒数，之后每次翻倍
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RetryTransport(httpx.BaseTransport):
+    """
+    临时错误（连接失败、超时、429和5xx）按指数退避重试的传输层
+
+    OpenAI客户端自身的重试关闭（max_retries=0），SDK发出的请求和预先序列化的图片请求
+    都只经过这一层重试。
+    """
+
+    def __init__(self, transport, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+
+    def handle_request(self, request):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    return response
+                response.close()
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def close(self):
+        self.transport.close()
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """每个HTTP请求发出前先向调度器领取许可的传输层（见request_scheduler）"""
+
+    def __init__(self, transport, scheduler):
+        self.transport = transport
+        self.scheduler = scheduler
+
+    def handle_request(self, request):
+        priority, tenant = current_scheduling()
+        with self.scheduler.slot(priority, tenant):
+            response = self.transport.handle_request(request)
+            # 读完响应体再释放许可，避免读取响应期间的占用不被计数
+            try:
+                response.read()
+            finally:
+                response.close()
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+_http_client = None
+_http_config = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """
+    返回所有模型请求共用的httpx客户端
+
+    OpenAI客户端通过http_client参数使用它，预先序列化的图片请求（见image_payload）也直接经由它发送，
+    两者共用连接池和同一套重试（RetryTransport）。录制文件只打开一次；录制/回放配置改变后重新创建。
+    启用调度时（见request_scheduler），每次尝试发出前先领取许可，回放的请求同样参与调度。
+    """
+    global _http_client, _http_config
+    with _client_lock:
+        config = cassette_config()
+        if _http_client is not None and config == _http_config:
+            return _http_client
+        transport = create_transport(*config)
+        scheduler = get_scheduler()
+        if scheduler is not None:
+            transport = ScheduledTransport(transport, scheduler)
+        _http_client = httpx.Client(transport=RetryTransport(transport), timeout=httpx.Timeout(600.0, connect=5.0))
+        _http_config = config
+        return _http_client
@@ -0,0 +1,161 @@
+import os
+
+
+HASH_SIZE = 8  # 8x8 -> 64位哈希
+MAX_BRIGHTNESS_DIFF = 16  # 平均亮度差超过该值不视为重复（纯色图的哈希相同但颜色不同）
+COLOR_GRID_SIZE = 4       # 颜色特征：4x4缩略图各格的RGB均值
+MAX_COLOR_DIFF = 24       # 任一格任一通道均值差超过该值不视为重复（同版式不同配色的商品图）
+
+
+def average_hash(image, hash_size=HASH_SIZE):
+    """计算图片的aHash（灰度缩略图中高于均值的像素记为1）"""
+    from PIL import Image
+
+    small = image.convert('L').resize((hash_size, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    mean = sum(pixels) / len(pixels)
+    value = 0
+    for pixel in pixels:
+        value = (value << 1) | (pixel > mean)
+    return value
+
+
+def difference_hash(image, hash_size=HASH_SIZE):
+    """计算图片的dHash（相邻像素的亮度梯度）"""
+    from PIL import Image
+
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    width = hash_size + 1
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * width + col]
+            right = pixels[row * width + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def color_signature(image, grid_size=COLOR_GRID_SIZE):
+    """计算图片的颜色特征（grid_size x grid_size缩略图各格的R、G、B均值）"""
+    from PIL import Image
+
+    small = image.convert('RGB').resize((grid_size, grid_size), Image.BOX)
+    return tuple(channel for pixel in small.getdata() for channel in pixel)
+
+
+def color_distance(a, b):
+    """两个颜色特征之间的最大单格单通道差"""
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+def image_hashes(image_path):
+    """
+    计算图片的(aHash, dHash, 平均亮度, 颜色特征)
+
+    aHash和dHash只看灰度，颜色特征用于区分版式相同、配色不同的图片。
+
+    Returns:
+        tuple: (aHash, dHash, 平均亮度, 颜色特征)；图片无法读取时返回None
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(image_path) as img:
+            # 大图先用draft/thumbnail缩小，避免完整解码
+            img.draft('RGB', (128, 128))
+            img.thumbnail((128, 128))
+            gray = img.convert('L')
+            brightness = sum(gray.getdata()) / (gray.width * gray.height)
+            return average_hash(gray), difference_hash(gray), brightness, color_signature(img)
+    except Exception as e:
+        print(f"计算图片哈希失败 {os.path.basename(image_path)}: {str(e)}")
+        return None
+
+
+def hamming_distance(a, b):
+    """两个哈希值之间的汉明距离"""
+    return bin(a ^ b).count('1')
+
+
+class _BKTree:
+    """按dHash汉明距离组织的BK树，用于快速查找相近的代表图片"""
+
+    def __init__(self):
+        self._root = None  # [dHash, 簇编号, {距离: 子节点}]
+
+    def add(self, value, cluster_id):
+        node = [value, cluster_id, {}]
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, threshold):
+        """返回与value距离不超过threshold的(距离, 簇编号)列表"""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= threshold:
+                found.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - threshold <= child_distance <= distance + threshold:
+                    stack.append(child)
+        return found
+
+
+def cluster_near_duplicates(image_paths, threshold=4):
+    """
+    将近似重复的图片分组
+
+    aHash和dHash的汉明距离都不超过threshold、平均亮度和各区域颜色都接近时视为重复。每组的第一张图片作为代表，
+    无法计算哈希的图片单独成组。
+
+    Args:
+        image_paths: 图片路径列表
+        threshold: 汉明距离阈值（0~64），越小越严格
+
+    Returns:
+        list: 分组列表，每组为图片路径列表，代表图片在首位，组顺序与输入顺序一致
+    """
+    clusters = []
+    representatives = []  # 簇编号 -> 代表图片的(aHash, dHash, 平均亮度, 颜色特征)
+    tree = _BKTree()
+
+    for path in image_paths:
+        hashes = image_hashes(path)
+        if hashes is None:
+            clusters.append([path])
+            representatives.append(None)
+            continue
+
+        a_hash, d_hash, brightness, colors = hashes
+        best = None
+        for distance, cluster_id in tree.search(d_hash, threshold):
+            rep_a_hash, _, rep_brightness, rep_colors = representatives[cluster_id]
+            if hamming_distance(a_hash, rep_a_hash) > threshold:
+                continue
+            if abs(brightness - rep_brightness) > MAX_BRIGHTNESS_DIFF:
+                continue
+            if color_distance(colors, rep_colors) > MAX_COLOR_DIFF:
+                continue
+            if best is None or distance < best[0]:
+                best = (distance, cluster_id)
+
+        if best is not None:
+            clusters[best[1]].append(path)
+        else:
+            tree.add(d_hash, len(clusters))
+            clusters.append([path])
+            representatives.append(hashes)
+
+    return clusters
@@ -0,0 +1,231 @@
+import os
+import json
+import struct
+import base64
+
+from token_budget import prompt_fingerprint
+
+
+HEADER_READ_SIZE = 64 * 1024
+ENCODE_CHUNK_SIZE = 3 * 1024 * 1024  # 3的倍数，分块base64编码后可直接拼接
+IMAGE_URL_PLACEHOLDER = "__IMAGE_DATA_URL__"
+
+FORMAT_MIME_TYPES = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'GIF': 'image/gif',
+    'BMP': 'image/bmp',
+    'TIFF': 'image/tiff',
+    'WEBP': 'image/webp'
+}
+
+
+def _jpeg_size(data):
+    """在JPEG数据中查找SOF段，返回(宽, 高)"""
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            offset += 1
+            continue
+        marker = data[offset + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            offset += 1 if marker == 0xFF else 2
+            continue
+        length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def read_image_header(image_path):
+    """
+    只读取文件头获取图片尺寸和格式，不解码像素
+
+    支持PNG、GIF、BMP、JPEG、WEBP(VP8X)，其他格式交给PIL惰性读取文件头。
+
+    Returns:
+        tuple: ((宽, 高), 格式)；无法识别时尺寸为None
+    """
+    with open(image_path, 'rb') as f:
+        head = f.read(HEADER_READ_SIZE)
+
+    if head.startswith(b'\x89PNG\r\n\x1a\n') and len(head) >= 24:
+        return struct.unpack('>II', head[16:24]), 'PNG'
+    if head[:6] in (b'GIF87a', b'GIF89a') and len(head) >= 10:
+        return struct.unpack('<HH', head[6:10]), 'GIF'
+    if head.startswith(b'BM') and len(head) >= 26:
+        width, height = struct.unpack('<ii', head[18:26])
+        return (width, abs(height)), 'BMP'
+    if head.startswith(b'\xff\xd8'):
+        size = _jpeg_size(head)
+        if size:
+            return size, 'JPEG'
+    if head[:4] == b'RIFF' and head[8:16] == b'WEBPVP8X' and len(head) >= 30:
+        width = int.from_bytes(head[24:27], 'little') + 1
+        height = int.from_bytes(head[27:30], 'little') + 1
+        return (width, height), 'WEBP'
+
+    from PIL import Image
+    with Image.open(image_path) as img:
+        return img.size, img.format
+
+
+def image_data_url(image_path):
+    """
+    读取图片并编码为data URL，MIME类型按文件头识别
+
+    用于一次请求包含多张图片的批量分析，同一批图片的data URL在各模型之间共用。
+    """
+    try:
+        _, image_format = read_image_header(image_path)
+    except Exception:
+        image_format = None
+    mime_type = FORMAT_MIME_TYPES.get(image_format, 'image/jpeg')
+    with open(image_path, 'rb') as f:
+        return f"data:{mime_type};base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+
+class ImagePayload:
+    """
+    单张图片的请求体模板
+
+    图片按块读取并直接base64编码进请求体模板，只保留一份编码后的数据。
+    同一张图片发给多个模型时共用这份模板，每个模型只额外拼接几十字节的模型名和参数。
+    提示词只在用户消息中出现一次，不再同时作为系统消息重复发送。
+    budget_key为token统计（见token_budget）的提示词键，默认取提示词指纹。
+    """
+
+    def __init__(self, image_path, prompt, temperature=0.5, budget_key=None):
+        self.image_path = image_path
+        self.budget_key = budget_key or prompt_fingerprint(prompt)
+        self.file_size = os.path.getsize(image_path)
+        try:
+            self.size, self.format = read_image_header(image_path)
+        except Exception:
+            self.size, self.format = None, None
+        self.mime_type = FORMAT_MIME_TYPES.get(self.format, 'image/jpeg')
+
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": IMAGE_URL_PLACEHOLDER}}
+                ]
+            }
+        ]
+        skeleton = json.dumps({"messages": messages, "temperature": temperature},
+                              ensure_ascii=False, separators=(',', ':'))
+        # 去掉开头的"{"，模型名和max_tokens在发送时拼在前面
+        before, after = skeleton[1:].split(f'"{IMAGE_URL_PLACEHOLDER}"', 1)
+
+        encoded_size = 4 * ((self.file_size + 2) // 3)
+        self.encoded_size = encoded_size
+        self.template = bytearray()
+        self.template += before.encode('utf-8')
+        self.template += f'"data:{self.mime_type};base64,'.encode('ascii')
+        peak = 0
+        with open(image_path, 'rb') as f:
+            while True:
+                chunk = f.read(ENCODE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.template += base64.b64encode(chunk)
+                peak = max(peak, len(self.template) + len(chunk) * 7 // 3)
+        self.template += b'"'
+        self.template += after.encode('utf-8')
+        # 峰值：模板 + 当前读取块及其编码结果（不再有完整原图、base64字节串、data URL字符串等中间副本）
+        self.peak_bytes = max(peak, len(self.template))
+
+    @property
+    def body_size(self):
+        return len(self.template)
+
+    def body_parts(self, model, max_tokens):
+        """返回某个模型的请求体分段（共享模板，不复制图片数据）"""
+        head = ('{"model":%s,"max_tokens":%d,' % (json.dumps(model), max_tokens)).encode('utf-8')
+        return [head, self.template]
+
+    def stats(self):
+        """返回请求体大小和内存占用统计"""
+        return {
+            'file_size': self.file_size,
+            'encoded_size': self.encoded_size,
+            'body_size': self.body_size,
+            'peak_bytes': self.peak_bytes,
+            'image_size': self.size,
+            'format': self.format
+        }
+
+
+def _parse_chat_completion(data):
+    """
+    将JSON响应转换为openai的ChatCompletion对象
+
+    与client.chat.completions.create一致，用construct构建而不做校验：
+    代理转发的Claude、豆包等模型可能返回"end_turn"或null等非标准finish_reason。
+    """
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.construct(**data)
+
+
+def _status_error(response):
+    """把错误响应转换为openai的异常类型（与client.chat.completions.create抛出的一致）"""
+    from openai import (APIStatusError, AuthenticationError, BadRequestError, ConflictError,
+                        InternalServerError, NotFoundError, PermissionDeniedError, RateLimitError,
+                        UnprocessableEntityError)
+
+    error_types = {400: BadRequestError, 401: AuthenticationError, 403: PermissionDeniedError,
+                   404: NotFoundError, 409: ConflictError, 422: UnprocessableEntityError, 429: RateLimitError}
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    error_type = InternalServerError if response.status_code >= 500 else error_types.get(response.status_code, APIStatusError)
+    return error_type(f"Error code: {response.status_code} - {body}", response=response, body=body)
+
+
+def post_chat_completion(client, payload, model, max_tokens):
+    """
+    用预先序列化的请求体调用chat/completions
+
+    请求经由create_client传给OpenAI客户端的同一个httpx客户端（见http_client）发送，
+    共用连接池、重试和录制/回放，鉴权头和超时取自OpenAI客户端，但跳过对消息的逐次JSON序列化。
+
+    Args:
+        client: OpenAI客户端
+        payload: ImagePayload
+        model: 模型名称
+        max_tokens: 最大生成token数
+
+    Returns:
+        ChatCompletion: 与client.chat.completions.create相同的响应对象
+
+    Raises:
+        openai.APIStatusError / APIConnectionError / APITimeoutError: 与SDK相同的异常类型
+    """
+    import httpx
+    from openai import APIConnectionError, APITimeoutError
+    from http_client import get_http_client
+
+    parts = payload.body_parts(model, max_tokens)
+    # default_headers中未设置的项是Omit占位对象，只保留字符串值
+    headers = {key: value for key, value in client.default_headers.items() if isinstance(value, str)}
+    headers['Content-Type'] = 'application/json'
+    headers['Content-Length'] = str(sum(len(part) for part in parts))
+
+    http_client = get_http_client()
+    request = http_client.build_request('POST', client.base_url.join('chat/completions'),
+                                        content=parts, headers=headers, timeout=client.timeout)
+    try:
+        response = http_client.send(request)
+    except httpx.TimeoutException as e:
+        raise APITimeoutError(request=request) from e
+    except httpx.TransportError as e:
+        raise APIConnectionError(request=request) from e
+    if response.status_code >= 400:
+        raise _status_error(response)
+    return _parse_chat_completion(response.json())
@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+
+
+PDF_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff'}
+PDF_CONTEXT_CHARS = 2000  # 附加到提示词中的页面文字最大长度
+MANIFEST_NAME = 'manifest.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """分块计算文件的SHA-256"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def iter_pdf_pages(pdf_path):
+    """
+    逐页读取PDF
+
+    Yields:
+        tuple: (页码(从1开始), 页面文字, PyPDF2页面对象)
+    """
+    import PyPDF2
+
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for index, page in enumerate(reader.pages, 1):
+            try:
+                text = page.extract_text() or ''
+            except Exception as e:
+                print(f"读取PDF第{index}页文字时出错：{str(e)}")
+                text = ''
+            yield index, text, page
+
+
+def _page_images(page, page_number):
+    """取出页面中的嵌入图片，提取失败时跳过该页"""
+    try:
+        return page.images
+    except Exception as e:
+        print(f"提取PDF第{page_number}页图片时出错：{str(e)}")
+        return []
+
+
+def extract_pdf_images(pdf_path, cache_dir=None):
+    """
+    逐页提取PDF中的嵌入图片，并附带所在页的文字
+
+    图片按PDF内容哈希缓存，同一份文档再次运行时直接读取缓存清单，不再解析PDF。
+
+    Args:
+        pdf_path: PDF文件路径
+        cache_dir: 缓存根目录，默认为PDF所在目录下的pdf_cache
+
+    Yields:
+        dict: {'path': 图片路径, 'page': 页码, 'page_text': 页面文字}
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(pdf_path)), 'pdf_cache')
+    doc_dir = os.path.join(cache_dir, file_sha256(pdf_path))
+    manifest_path = os.path.join(doc_dir, MANIFEST_NAME)
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        if all(os.path.exists(os.path.join(doc_dir, entry['file'])) for entry in entries):
+            print(f"使用PDF图片缓存: {doc_dir}")
+            for entry in entries:
+                yield {'path': os.path.join(doc_dir, entry['file']), 'page': entry['page'],
+                       'page_text': entry['page_text']}
+            return
+
+    os.makedirs(doc_dir, exist_ok=True)
+    entries = []
+    for page_number, text, page in iter_pdf_pages(pdf_path):
+        for index, image in enumerate(_page_images(page, page_number), 1):
+            extension = os.path.splitext(image.name)[1].lower()
+            if extension not in PDF_IMAGE_EXTENSIONS:
+                print(f"跳过PDF第{page_number}页不支持的图片格式: {image.name}")
+                continue
+            filename = f"p{page_number:04d}_{index:02d}{extension}"
+            with open(os.path.join(doc_dir, filename), 'wb') as f:
+                f.write(image.data)
+            entries.append({'file': filename, 'page': page_number, 'page_text': text})
+            yield {'path': os.path.join(doc_dir, filename), 'page': page_number, 'page_text': text}
+
+    # 全部提取完成后再写清单，中途中断的提取不会被当作缓存命中
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def page_context_prompt(prompt, page_text, max_chars=PDF_CONTEXT_CHARS):
+    """将页面文字作为上下文附加到提示词"""
+    page_text = ' '.join(page_text.split())
+    if not page_text:
+        return prompt
+    if len(page_text) > max_chars:
+        page_text = page_text[:max_chars] + '…'
+    return f"{prompt}\n\n该图片所在PDF页面的文字内容（供参考）:\n{page_text}"
@@ -0,0 +1,154 @@
+import os
+import time
+import threading
+from collections import deque
+
+from stats_file import JsonStatsFile, shared_instance
+
+
+STATS_FILE_ENV = "PROMPT_STATS_FILE"
+DEFAULT_STATS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_stats.json")
+TRANSLATE_KEY = "翻译"     # 翻译请求的统计键
+DEFAULT_LATENCY = 15.0     # 没有历史数据的模型按15秒估计
+WINDOW_SIZE = 50           # 每个模型保留最近50次耗时
+EWMA_ALPHA = 0.2
+PRIOR_IMAGES = 3           # 已完成图片数达到该值时，实测速度与历史估计各占一半
+
+
+class ModelLatencyStats(JsonStatsFile):
+    """
+    各模型的滚动耗时统计
+
+    记录每个模型最近的请求耗时（滑动窗口 + 指数加权平均）和成功/失败次数，
+    持久化到JSON文件，新任务启动时即可用历史数据估计剩余时间。
+    """
+
+    name = "模型耗时统计"
+
+    def __init__(self, path):
+        self._models = {}
+        super().__init__(path)
+
+    def _restore(self, data):
+        for model, entry in data.get('models', {}).items():
+            self._models[model] = {
+                'ewma': entry.get('ewma'),
+                'recent': deque(entry.get('recent', []), maxlen=WINDOW_SIZE),
+                'ok': entry.get('ok', 0),
+                'failed': entry.get('failed', 0)
+            }
+
+    def record(self, model, seconds, ok=True):
+        """记录一次请求耗时"""
+        with self._lock:
+            entry = self._models.setdefault(model, {
+                'ewma': None, 'recent': deque(maxlen=WINDOW_SIZE), 'ok': 0, 'failed': 0
+            })
+            entry['recent'].append(round(seconds, 3))
+            entry['ewma'] = seconds if entry['ewma'] is None else \
+                EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * entry['ewma']
+            entry['ok' if ok else 'failed'] += 1
+            should_save = self._mark_dirty()
+        if should_save:
+            self.save()
+
+    def expected(self, model):
+        """模型单次请求的预计耗时（秒）"""
+        with self._lock:
+            entry = self._models.get(model)
+            if not entry or entry['ewma'] is None:
+                return DEFAULT_LATENCY
+            return entry['ewma']
+
+    def expected_image_seconds(self, models, translate=True):
+        """分析一张图片的预计耗时：各模型依次请求，非双语模式每个结果再翻译一次"""
+        seconds = sum(self.expected(model) for model in models)
+        if translate:
+            seconds += self.expected(TRANSLATE_KEY) * len(models)
+        return seconds
+
+    def summary(self):
+        """返回各模型的统计摘要"""
+        with self._lock:
+            summary = {}
+            for model, entry in self._models.items():
+                recent = sorted(entry['recent'])
+                summary[model] = {
+                    'ewma': round(entry['ewma'], 3) if entry['ewma'] is not None else None,
+                    'p50': recent[len(recent) // 2] if recent else None,
+                    'p90': recent[int(len(recent) * 0.9)] if recent else None,
+                    'ok': entry['ok'],
+                    'failed': entry['failed']
+                }
+            return summary
+
+    def _snapshot(self):
+        return {'models': {
+            model: {'ewma': entry['ewma'], 'recent': list(entry['recent']),
+                    'ok': entry['ok'], 'failed': entry['failed']}
+            for model, entry in self._models.items()
+        }}
+
+
+class ProgressTracker:
+    """
+    单个任务的进度、吞吐量和剩余时间估计
+
+    剩余时间 = 剩余图片数 × 每张图片的估计耗时。估计耗时由历史统计和本任务实测速度加权得到，
+    已完成的图片越多，实测速度的权重越大。
+    """
+
+    def __init__(self, total, models, stats=None, translate=True):
+        self.total = total
+        self.models = list(models)
+        self.stats = stats or get_latency_stats()
+        self.translate = translate
+        self.start_time = time.time()
+        self.done = 0
+        self.model_done = {model: 0 for model in self.models}
+        self._lock = threading.Lock()
+
+    def image_done(self, succeeded_models=()):
+        """记录一张图片完成，succeeded_models为成功返回结果的模型"""
+        with self._lock:
+            self.done += 1
+            for model in succeeded_models:
+                self.model_done[model] = self.model_done.get(model, 0) + 1
+
+    def snapshot(self):
+        """返回当前进度信息"""
+        with self._lock:
+            elapsed = time.time() - self.start_time
+            done, total = self.done, self.total
+            model_done = dict(self.model_done)
+        expected = self.stats.expected_image_seconds(self.models, self.translate)
+        if done:
+            weight = done / (done + PRIOR_IMAGES)
+            per_image = weight * (elapsed / done) + (1 - weight) * expected
+        else:
+            per_image = expected
+        remaining = max((total or 0) - done, 0)
+        return {
+            'elapsed_seconds': round(elapsed, 1),
+            'images_done': done,
+            'images_total': total,
+            'images_per_min': round(done / elapsed * 60, 2) if done and elapsed > 0 else None,
+            'seconds_per_image': round(per_image, 1),
+            'eta_seconds': round(remaining * per_image, 1),
+            'model_done': model_done
+        }
+
+
+def format_duration(seconds):
+    """将秒数格式化为 时:分:秒 / 分:秒"""
+    seconds = int(round(seconds or 0))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def get_latency_stats():
+    """返回全局模型耗时统计（路径可通过PROMPT_STATS_FILE设置）"""
+    return shared_instance(ModelLatencyStats, STATS_FILE_ENV, DEFAULT_STATS_FILE)
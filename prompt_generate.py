@@ -1,15 +1,18 @@
 import os
-import sys
-import pandas as pd
-import PyPDF2
 import glob
-from PIL import Image
+import json
+import time
+import argparse
 import warnings
 from datetime import datetime
-try:
-    import openpyxl
-except ImportError:
-    print("警告: 未安装openpyxl库，Excel功能可能无法正常使用。请运行: pip install openpyxl")
+from image_payload import ImagePayload, image_data_url, post_chat_completion
+from progress_stats import ProgressTracker, get_latency_stats, format_duration, TRANSLATE_KEY
+from result_store import result_to_record, archive_results
+from token_budget import get_token_budget, prompt_fingerprint
+from pdf_source import file_sha256
+
+# PyPDF2、PIL、openpyxl、openai等较重的依赖在使用处按需导入，
+# 以免 --help、状态查询等不需要它们的路径也承担导入开销
 
 warnings.filterwarnings("ignore")
 
@@ -34,9 +37,49 @@ DEFAULT_MODELS = [
     "claude-3-7-sonnet-v1"
 ]
 
+# 每个模型单次请求打包的图片数，未配置的模型逐张分析
+MODEL_BATCH_SIZES = {}
+
+# 批量分析时追加的说明，要求模型按图片标签返回JSON
+BATCH_PROMPT_TEMPLATE = (
+    "{prompt}\n\n"
+    "下面共有{count}张图片，依次标记为{labels}。请对每张图片分别完成上述分析。"
+    "只返回一个JSON对象，键为图片标签，值为按上述要求给出的该图片分析结果，不要输出其他内容。"
+)
+
+# 近似重复图片的汉明距离阈值（aHash和dHash都不超过该值视为重复），None表示不去重
+DEDUP_HAMMING_THRESHOLD = 4
+
+# 双语模式追加的说明，要求模型一次返回中文分析和英文prompt
+BILINGUAL_INSTRUCTION = (
+    "\n\n请用JSON格式返回结果，包含两个字段："
+    "\"analysis\"为中文分析内容，\"english_prompt\"为对应的英文版本。"
+    "只返回JSON对象，不要输出其他内容。"
+)
+
+# 文本中中日韩字符占比低于该值时视为英文，无需翻译
+ENGLISH_CJK_RATIO = 0.05
+
+# max_tokens按各模型/提示词实际输出长度自动调整（见token_budget），统计不足时使用默认值；
+# 输出被截断时以上限重试一次
+ANALYSIS_MAX_TOKENS = 1000
+TRANSLATE_MAX_TOKENS = 2000
+MAX_TOKENS_CEILING = 4096
+TRANSLATE_MODEL = "gpt-4o-0806"  # 使用稳定的模型进行翻译
+TRANSLATE_BUDGET_KEY = "translate"
+
+def is_english_text(text):
+    """判断文本是否已经是英文（中日韩字符占比低于ENGLISH_CJK_RATIO）"""
+    letters = [ch for ch in text if ch.isalpha()]
+    if not letters:
+        return True
+    cjk = sum(1 for ch in letters if '\u3040' <= ch <= '\u30ff' or '\u3400' <= ch <= '\u9fff'
+              or '\uac00' <= ch <= '\ud7af' or '\uf900' <= ch <= '\ufaff')
+    return cjk / len(letters) < ENGLISH_CJK_RATIO
+
 def translate_to_english(chinese_text):
     """
-    将中文文本翻译为英文
+    将中文文本翻译为英文（已经是英文的文本直接返回）
     
     Args:
         chinese_text: 需要翻译的中文文本
@@ -44,47 +87,63 @@ def translate_to_english(chinese_text):
     Returns:
         str: 翻译后的英文文本
     """
+    if not chinese_text or is_english_text(chinese_text):
+        return chinese_text
+    
+    start = time.time()
     try:
-        from openai import OpenAI
-        
         # 初始化OpenAI客户端
-        client = OpenAI(
-            api_key=os.environ["OPENAI_API_KEY"],
-            base_url=os.environ["OPENAI_API_BASE"]
-        )
+        client = create_client()
+        
+        # 译文长度与原文长度成正比，按每个原文字符的输出token数统计
+        budget = get_token_budget()
+        max_tokens = budget.max_tokens(TRANSLATE_MODEL, TRANSLATE_BUDGET_KEY, TRANSLATE_MAX_TOKENS,
+                                       MAX_TOKENS_CEILING, scale=len(chinese_text))
+        messages = [
+            {
+                "role": "system",
+                "content": "You are a professional translator. Please translate the following Chinese text to English. Keep the meaning accurate and the language natural. Only return the translated text without any additional explanation."
+            },
+            {
+                "role": "user",
+                "content": chinese_text
+            }
+        ]
         
         # 使用GPT进行翻译
         response = client.chat.completions.create(
-            model="gpt-4o-0806",  # 使用稳定的模型进行翻译
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a professional translator. Please translate the following Chinese text to English. Keep the meaning accurate and the language natural. Only return the translated text without any additional explanation."
-                },
-                {
-                    "role": "user",
-                    "content": chinese_text
-                }
-            ],
+            model=TRANSLATE_MODEL,
+            messages=messages,
             temperature=0.3,
-            max_tokens=2000
+            max_tokens=max_tokens
         )
+        truncated = budget.record_response(TRANSLATE_MODEL, TRANSLATE_BUDGET_KEY, response, max_tokens,
+                                           scale=len(chinese_text))
+        if truncated and max_tokens < MAX_TOKENS_CEILING:
+            print(f"  翻译结果被截断（max_tokens={max_tokens}），以上限 {MAX_TOKENS_CEILING} 重试")
+            response = client.chat.completions.create(
+                model=TRANSLATE_MODEL,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=MAX_TOKENS_CEILING
+            )
+            budget.record_response(TRANSLATE_MODEL, TRANSLATE_BUDGET_KEY, response, MAX_TOKENS_CEILING,
+                                   scale=len(chinese_text))
         
+        get_latency_stats().record(TRANSLATE_KEY, time.time() - start)
         return response.choices[0].message.content.strip()
         
     except Exception as e:
-        print(f"  翻译失败: {str(e)}")
-        return f"Translation failed: {str(e)}"
+        get_latency_stats().record(TRANSLATE_KEY, time.time() - start, ok=False)
+        print(f"  翻译失败: {_error_message(e)}")
+        return f"Translation failed: {_error_message(e)}"
 
 def read_pdf(pdf_path):
-    """读取PDF文件内容"""
+    """读取PDF文件内容（逐页读取后一次拼接）"""
     try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+        from pdf_source import iter_pdf_pages
+        
+        return "".join(text + "\n" for _, text, _ in iter_pdf_pages(pdf_path))
     except Exception as e:
         print(f"读取PDF文件时出错：{str(e)}")
         return ""
@@ -107,7 +166,7 @@ def get_image_files(image_dir):
     
     return sorted(image_files)
 
-def analyze_single_image(image_path, prompt=None, models=None):
+def analyze_single_image(image_path, prompt=None, models=None, budget_key=None):
     """
     使用多个模型分析单个图片
     
@@ -115,6 +174,8 @@ def analyze_single_image(image_path, prompt=None, models=None):
         image_path: 图片路径
         prompt: 分析提示词，如果为None则使用默认提示词
         models: 要使用的模型列表，如果为None则使用默认模型列表
+        budget_key: max_tokens统计的提示词键，默认取提示词指纹
+                    （提示词逐张不同但输出长度相近时传入同一个键）
     
     Returns:
         tuple: (最佳模型名称, 分析结果)
@@ -127,97 +188,25 @@ def analyze_single_image(image_path, prompt=None, models=None):
     
     print(f"正在分析图片: {os.path.basename(image_path)}")
     
-    # 获取图片信息
+    # 读取图片并构建请求体模板（只读文件头获取尺寸格式，图片只编码一次，所有模型共用）
     try:
-        img = Image.open(image_path)
-        image_info = f"图片路径: {image_path}\n图片尺寸: {img.size}\n图片格式: {img.format}"
+        payload = ImagePayload(image_path, prompt, budget_key=budget_key)
     except Exception as e:
-        image_info = f"图片路径: {image_path}\n无法读取图片信息: {str(e)}"
-    
-    # 构建完整提示词
-    full_prompt = f"{prompt}\n\n图片信息:\n{image_info}"
+        # 内容以"分析失败"开头，调用方按失败处理，不会翻译或计入成功结果
+        return [("编码失败", f"分析失败: 图片base64编码失败: {str(e)}")]
     
-    # 将图片转换为base64编码
-    import base64
-    try:
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-    except Exception as e:
-        return "编码失败", f"图片base64编码失败: {str(e)}"
+    stats = payload.stats()
+    print(f"  图片尺寸: {stats['image_size']}，格式: {stats['format']}，"
+          f"请求体 {stats['body_size'] / 1024 / 1024:.1f}MB，峰值内存约 {stats['peak_bytes'] / 1024 / 1024:.1f}MB")
     
     try:
-        # 使用新版本OpenAI库（1.0+）
-        from openai import OpenAI
-        
         # 初始化OpenAI客户端
-        client = OpenAI(
-            api_key=os.environ["OPENAI_API_KEY"],
-            base_url=os.environ["OPENAI_API_BASE"]
-        )
-        
-        from collections import Counter
-        model_results = []
-        analysis_results = []
-        
-        # 使用每个模型进行分析
-        for model in models:
-            try:
-                print(f"  使用模型 {model} 分析中...")
-                
-                # 新版本API调用 - 包含图片数据
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": prompt if prompt else DEFAULT_PROMPT
-                        },
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                            ]
-                        }
-                    ],
-                    temperature=0.5,
-                    max_tokens=1000
-                )
-                
-                # 添加更强的错误处理
-                if response and hasattr(response, 'choices') and response.choices and len(response.choices) > 0:
-                    if hasattr(response.choices[0], 'message') and hasattr(response.choices[0].message, 'content'):
-                        result = response.choices[0].message.content
-                        if result:
-                            model_results.append(model)
-                            analysis_results.append(f"[{model}分析结果]\n{result}")
-                            print(f"  模型 {model} 分析完成")
-                        else:
-                            print(f"  模型 {model} 返回空结果")
-                            analysis_results.append(f"[{model}分析结果]\n分析失败: 模型返回空结果")
-                    else:
-                        print(f"  模型 {model} 响应格式异常")
-                        analysis_results.append(f"[{model}分析结果]\n分析失败: 响应格式异常")
-                else:
-                    print(f"  模型 {model} 响应为空或无choices")
-                    analysis_results.append(f"[{model}分析结果]\n分析失败: 响应为空或无choices")
-
-            except Exception as e:
-                print(f"  模型 {model} 分析失败: {str(e)}")
-                analysis_results.append(f"[{model}分析结果]\n分析失败: {str(e)}")
-
+        client = create_client()
         
-        # 返回每个模型的独立结果
+        # 使用每个模型进行分析，返回每个模型的独立结果
         model_analysis_pairs = []
-        for i, model in enumerate(models):
-            if i < len(analysis_results):
-                # 提取纯净的分析结果（去掉模型名称前缀）
-                result_text = analysis_results[i]
-                if result_text.startswith(f"[{model}分析结果]\n"):
-                    clean_result = result_text[len(f"[{model}分析结果]\n"):]
-                else:
-                    clean_result = result_text
-                model_analysis_pairs.append((model, clean_result))
+        for model in models:
+            model_analysis_pairs.append((model, _analyze_with_model(client, model, payload)))
         
         if model_analysis_pairs:
             return model_analysis_pairs
@@ -225,19 +214,296 @@ def analyze_single_image(image_path, prompt=None, models=None):
             return [("分析失败", "所有模型都无法完成分析")]
             
     except Exception as e:
-        error_msg = f"分析过程中出现错误: {str(e)}"
+        error_msg = f"分析失败: 分析过程中出现错误: {str(e)}"
         print(f"  {error_msg}")
         return [("分析失败", error_msg)]
 
-def analyze_images_to_excel(image_dir=None, prompt=None, output_file=None, models=None):
+def _error_message(error):
+    """
+    异常信息
+
+    OpenAI SDK把传输层抛出的非网络异常包装为"Connection error."，回放缺少录制时取出原始原因。
+    """
+    from replay_transport import CassetteMissError
+    
+    if isinstance(error.__cause__, CassetteMissError):
+        return str(error.__cause__)
+    return str(error)
+
+def create_client():
+    """
+    创建OpenAI客户端（使用新版本OpenAI库 1.0+）
+    
+    所有客户端共用http_client模块中的httpx客户端：重试由其传输层统一处理（SDK自身不再重试），
+    启用录制/回放或请求调度时请求同样经过对应的传输层。
+    """
+    from openai import OpenAI
+    from http_client import get_http_client
+    
+    return OpenAI(
+        api_key=os.environ["OPENAI_API_KEY"],
+        base_url=os.environ["OPENAI_API_BASE"],
+        http_client=get_http_client(),
+        max_retries=0
+    )
+
+def _extract_content(model, response):
+    """
+    从响应中取出文本内容
+    
+    Returns:
+        tuple: (内容, 错误信息)，成功时错误信息为None
+    """
+    if response and hasattr(response, 'choices') and response.choices and len(response.choices) > 0:
+        if hasattr(response.choices[0], 'message') and hasattr(response.choices[0].message, 'content'):
+            result = response.choices[0].message.content
+            if result:
+                return result, None
+            print(f"  模型 {model} 返回空结果")
+            return None, "模型返回空结果"
+        print(f"  模型 {model} 响应格式异常")
+        return None, "响应格式异常"
+    print(f"  模型 {model} 响应为空或无choices")
+    return None, "响应为空或无choices"
+
+def _analyze_with_model(client, model, payload):
+    """使用单个模型分析单张图片，返回分析内容（失败时以"分析失败"开头）"""
+    start = time.time()
+    try:
+        print(f"  使用模型 {model} 分析中...")
+        
+        # 复用图片的请求体模板，只拼接模型名和参数
+        budget = get_token_budget()
+        max_tokens = budget.max_tokens(model, payload.budget_key, ANALYSIS_MAX_TOKENS, MAX_TOKENS_CEILING)
+        response = post_chat_completion(client, payload, model, max_tokens=max_tokens)
+        truncated = budget.record_response(model, payload.budget_key, response, max_tokens)
+        if truncated and max_tokens < MAX_TOKENS_CEILING:
+            print(f"  模型 {model} 输出被截断（max_tokens={max_tokens}），以上限 {MAX_TOKENS_CEILING} 重试")
+            response = post_chat_completion(client, payload, model, max_tokens=MAX_TOKENS_CEILING)
+            budget.record_response(model, payload.budget_key, response, MAX_TOKENS_CEILING)
+        
+        result, error = _extract_content(model, response)
+        get_latency_stats().record(model, time.time() - start, ok=not error)
+        if error:
+            return f"分析失败: {error}"
+        print(f"  模型 {model} 分析完成")
+        return result
+    
+    except Exception as e:
+        get_latency_stats().record(model, time.time() - start, ok=False)
+        print(f"  模型 {model} 分析失败: {str(e)}")
+        return f"分析失败: {str(e)}"
+
+def _extract_json_object(text):
+    """
+    取出模型回复中的JSON对象（第一个"{"到最后一个"}"之间，容忍前后的说明文字或代码块标记）
+    
+    Returns:
+        dict: 解析结果；找不到或不是JSON对象时返回None
+    """
+    if not text:
+        return None
+    start = text.find('{')
+    end = text.rfind('}')
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def parse_bilingual_reply(text):
+    """
+    解析双语模式的JSON回复
+    
+    Returns:
+        tuple: (中文分析, 英文prompt)；格式不符时返回None
+    """
+    data = _extract_json_object(text)
+    if data is None:
+        return None
+    analysis = data.get('analysis')
+    english = data.get('english_prompt')
+    if not isinstance(analysis, str) or not isinstance(english, str) or not analysis.strip():
+        return None
+    return analysis.strip(), english.strip()
+
+def split_bilingual_result(analysis_result):
+    """
+    从双语模式的结果中拆出中文分析和英文prompt
+    
+    解析失败时保留原文，并退回单独翻译。
+    
+    Returns:
+        tuple: (中文分析, 英文prompt)
+    """
+    parsed = parse_bilingual_reply(analysis_result)
+    if parsed and parsed[1]:
+        return parsed
+    if parsed:
+        analysis_result = parsed[0]
+    return analysis_result, translate_to_english(analysis_result)
+
+def parse_batch_reply(text, labels):
+    """
+    解析批量分析的JSON回复
+    
+    Args:
+        text: 模型返回的文本
+        labels: 图片标签列表
+    
+    Returns:
+        dict: 标签 -> 分析内容；格式不符或缺少任一标签时返回None
+    """
+    data = _extract_json_object(text)
+    if data is None:
+        return None
+    
+    parsed = {}
+    for label in labels:
+        value = data.get(label)
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, ensure_ascii=False)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        parsed[label] = value.strip()
+    return parsed
+
+def analyze_image_batch(client, model, prompt, image_paths, image_urls=None):
+    """
+    在一次请求中用单个模型分析多张图片
+    
+    每张图片前加上"图片N"标签，要求模型按标签返回JSON。
+    解析失败时自动退回逐张分析。
+    
+    Args:
+        client: OpenAI客户端
+        model: 模型名称
+        prompt: 分析提示词
+        image_paths: 图片路径列表
+        image_urls: 图片路径 -> data URL的缓存，多个模型分析同一批图片时传入同一个dict，每张图片只编码一次
+    
+    Returns:
+        list: 与image_paths一一对应的分析内容
+    """
+    labels = [f"图片{i}" for i in range(1, len(image_paths) + 1)]
+    
+    if len(image_paths) > 1:
+        if image_urls is None:
+            image_urls = {}
+        for path in image_paths:
+            if path not in image_urls:
+                image_urls[path] = image_data_url(path)
+        content = [{"type": "text", "text": BATCH_PROMPT_TEMPLATE.format(
+            prompt=prompt, count=len(labels), labels="、".join(labels))}]
+        for label, path in zip(labels, image_paths):
+            content.append({"type": "text", "text": f"[{label}] {os.path.basename(path)}"})
+            content.append({"type": "image_url", "image_url": {"url": image_urls[path]}})
+        
+        try:
+            print(f"  使用模型 {model} 批量分析 {len(image_paths)} 张图片...")
+            start = time.time()
+            # 提示词已包含在批量说明中，不再重复作为系统消息发送
+            budget = get_token_budget()
+            budget_key = prompt_fingerprint(prompt)
+            per_image = budget.max_tokens(model, budget_key, ANALYSIS_MAX_TOKENS, MAX_TOKENS_CEILING)
+            # 整批输出同样受模型上限约束
+            max_tokens = min(per_image * len(image_paths), MAX_TOKENS_CEILING)
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": content}
+                ],
+                temperature=0.5,
+                max_tokens=max_tokens
+            )
+            # 按每张图片的平均输出长度记录，与逐张分析共用统计
+            usage = response.usage
+            if usage is not None and usage.completion_tokens is not None:
+                budget.record(model, budget_key, usage.completion_tokens / len(image_paths),
+                              response.choices[0].finish_reason == 'length' if response.choices else False,
+                              max_tokens / len(image_paths),
+                              prompt_tokens=(usage.prompt_tokens or 0) / len(image_paths))
+            result, error = _extract_content(model, response)
+            parsed = parse_batch_reply(result, labels) if not error else None
+            # 按每张图片的平均耗时记录，与逐张分析的统计可直接比较
+            get_latency_stats().record(model, (time.time() - start) / len(image_paths), ok=bool(parsed))
+            if parsed:
+                print(f"  模型 {model} 批量分析完成")
+                return [parsed[label] for label in labels]
+            print(f"  模型 {model} 批量结果解析失败，改为逐张分析")
+        except Exception as e:
+            print(f"  模型 {model} 批量分析失败: {_error_message(e)}，改为逐张分析")
+        finally:
+            content = None
+    
+    return [_analyze_with_model(client, model, ImagePayload(path, prompt)) for path in image_paths]
+
+def analyze_images_batched(image_paths, prompt=None, models=None, batch_sizes=None, on_image_done=None):
+    """
+    按模型分批分析多张图片
+    
+    图片按窗口（最大批量大小）推进：一个窗口内的图片由所有模型分析完后再进入下一个窗口，
+    因此每个窗口结束时即可报告这些图片的进度；窗口内图片的data URL只编码一次，各模型共用。
+    
+    Args:
+        image_paths: 图片路径列表
+        prompt: 分析提示词
+        models: 模型列表
+        batch_sizes: 模型 -> 每次请求的图片数，默认使用MODEL_BATCH_SIZES
+        on_image_done: 每张图片所有模型分析完成后调用，参数为(图片路径, [(模型名, 分析内容), ...])
+    
+    Returns:
+        dict: 图片路径 -> [(模型名, 分析内容), ...]，模型顺序与models一致
+    """
+    if prompt is None:
+        prompt = DEFAULT_PROMPT
+    if models is None:
+        models = DEFAULT_MODELS
+    if batch_sizes is None:
+        batch_sizes = MODEL_BATCH_SIZES
+    
+    client = create_client()
+    pairs_by_image = {path: [] for path in image_paths}
+    sizes = {model: max(int(batch_sizes.get(model, 1)), 1) for model in models}
+    window = max(sizes.values()) if sizes else 1
+    
+    for window_start in range(0, len(image_paths), window):
+        window_paths = image_paths[window_start:window_start + window]
+        image_urls = {}
+        for model in models:
+            size = sizes[model]
+            for start in range(0, len(window_paths), size):
+                chunk = window_paths[start:start + size]
+                try:
+                    chunk_results = analyze_image_batch(client, model, prompt, chunk, image_urls)
+                except Exception as e:
+                    chunk_results = [f"分析失败: {str(e)}"] * len(chunk)
+                for path, result in zip(chunk, chunk_results):
+                    pairs_by_image[path].append((model, result))
+        if on_image_done is not None:
+            for path in window_paths:
+                on_image_done(path, pairs_by_image[path])
+    
+    return pairs_by_image
+
+def analyze_images_to_excel(image_dir=None, prompt=None, output_file=None, models=None, batch_sizes=None,
+                            bilingual=False, dedup_threshold=None):
     """
     分析指定目录下的所有图片并将结果保存到Excel文件
     
+    image_dir也可以是PDF文件：逐页提取其中的嵌入图片进行分析，并把所在页的文字作为提示词上下文。
+    
     Args:
-        image_dir: 图片目录路径，默认使用OPENIMG_DIR
+        image_dir: 图片目录路径（或PDF文件路径），默认使用OPENIMG_DIR
         prompt: 分析提示词，默认使用DEFAULT_PROMPT
         output_file: 输出Excel文件路径，默认保存到BASE_DIR
         models: 要使用的模型列表，默认使用预设模型
+        batch_sizes: 模型 -> 单次请求打包的图片数，默认使用MODEL_BATCH_SIZES
+        bilingual: 是否让模型一次返回中文分析和英文prompt，省去单独的翻译请求
+        dedup_threshold: 近似重复图片的汉明距离阈值，默认使用DEDUP_HAMMING_THRESHOLD，
+            传入负数时不去重
     
     Returns:
         str: 输出文件路径
@@ -251,6 +517,10 @@ def analyze_images_to_excel(image_dir=None, prompt=None, output_file=None, model
         output_file = DEFAULT_OUTPUT_FILE
     if models is None:
         models = DEFAULT_MODELS  # 使用默认模型列表
+    if batch_sizes is None:
+        batch_sizes = MODEL_BATCH_SIZES
+    if dedup_threshold is None:
+        dedup_threshold = DEDUP_HAMMING_THRESHOLD
     
     print("="*60)
     print("图片批量分析程序")
@@ -259,10 +529,20 @@ def analyze_images_to_excel(image_dir=None, prompt=None, output_file=None, model
     print(f"分析提示词: {prompt}")
     print(f"使用模型: {', '.join(models)}")
     print(f"输出文件: {output_file}")
+    if bilingual:
+        print("双语模式: 中文分析和英文prompt一次生成")
     print("="*60)
     
-    # 获取所有图片文件
-    image_files = get_image_files(image_dir)
+    # 获取所有图片文件（PDF文件则逐页提取嵌入图片，每张图片附带所在页文字）
+    image_prompts = {}
+    if os.path.isfile(image_dir) and image_dir.lower().endswith('.pdf'):
+        from pdf_source import extract_pdf_images, page_context_prompt
+        image_files = []
+        for pdf_image in extract_pdf_images(image_dir):
+            image_files.append(pdf_image['path'])
+            image_prompts[pdf_image['path']] = page_context_prompt(prompt, pdf_image['page_text'])
+    else:
+        image_files = get_image_files(image_dir)
     
     if not image_files:
         print("未找到任何图片文件，程序退出。")
@@ -270,21 +550,80 @@ def analyze_images_to_excel(image_dir=None, prompt=None, output_file=None, model
     
     print(f"找到 {len(image_files)} 个图片文件，开始分析...\n")
     
+    # 近似重复的图片只分析代表图片，结果复制给同组其他图片
+    duplicates = {}
+    analysis_files = image_files
+    if dedup_threshold is not None and dedup_threshold >= 0:
+        from image_dedup import cluster_near_duplicates
+        clusters = cluster_near_duplicates(image_files, dedup_threshold)
+        analysis_files = [cluster[0] for cluster in clusters]
+        duplicates = {cluster[0]: cluster[1:] for cluster in clusters if len(cluster) > 1}
+        if duplicates:
+            print(f"发现 {len(image_files) - len(analysis_files)} 张近似重复图片，"
+                  f"实际分析 {len(analysis_files)} 张\n")
+    
+    # 双语模式下在提示词后追加JSON输出要求
+    suffix = BILINGUAL_INSTRUCTION if bilingual else ""
+    request_prompt = prompt + suffix
+    
     # 准备结果数据
     results = []
+    archive_records = []  # 写入历史结果存储的行（只含成功的结果）
+    
+    # 进度与剩余时间估计（基于历史耗时统计和本次实测速度）
+    tracker = ProgressTracker(len(analysis_files), models, translate=not bilingual)
+    print(f"预计耗时: {format_duration(tracker.snapshot()['eta_seconds'])}\n")
+    
+    def print_progress():
+        progress = tracker.snapshot()
+        speed = f"{progress['images_per_min']} 张/分钟" if progress['images_per_min'] else "-"
+        models_done = "、".join(f"{model} {count}" for model, count in progress['model_done'].items())
+        print(f"  进度 {progress['images_done']}/{progress['images_total']}，速度 {speed}，"
+              f"已用 {format_duration(progress['elapsed_seconds'])}，"
+              f"预计剩余 {format_duration(progress['eta_seconds'])}，各模型完成 {models_done}\n")
+    
+    def batch_image_done(image_path, model_analysis_pairs):
+        tracker.image_done([model_name for model_name, analysis_result in model_analysis_pairs
+                            if not str(analysis_result).startswith("分析失败")])
+        print(f"[{tracker.done}/{len(analysis_files)}] 批量分析完成: {os.path.basename(image_path)}")
+        print_progress()
+    
+    # 配置了批量大小的模型先按批分析，减少请求次数，每批完成后报告进度
+    # （PDF图片的提示词各自附带页面文字，只能逐张分析）
+    batched_pairs = None
+    if not image_prompts and any(batch_sizes.get(model, 1) > 1 for model in models):
+        print(f"批量分析模式: {', '.join(f'{m}={batch_sizes.get(m, 1)}' for m in models)}\n")
+        try:
+            batched_pairs = analyze_images_batched(analysis_files, request_prompt, models, batch_sizes,
+                                                   on_image_done=batch_image_done)
+        except Exception as e:
+            print(f"批量分析失败，改为逐张分析: {str(e)}\n")
+            tracker = ProgressTracker(len(analysis_files), models, translate=not bilingual)
     
     # 逐个分析图片
-    for i, image_path in enumerate(image_files, 1):
-        print(f"[{i}/{len(image_files)}] 分析图片: {os.path.basename(image_path)}")
+    for i, image_path in enumerate(analysis_files, 1):
+        print(f"[{i}/{len(analysis_files)}] 分析图片: {os.path.basename(image_path)}")
+        first_row = len(results)
         
         try:
             # 分析图片
-            model_analysis_pairs = analyze_single_image(image_path, prompt, models)
+            if batched_pairs is not None:
+                model_analysis_pairs = batched_pairs[image_path]
+            else:
+                image_prompt = image_prompts.get(image_path, prompt) + suffix
+                # PDF图片的提示词附带各自页面文字，max_tokens按基础提示词统一统计
+                model_analysis_pairs = analyze_single_image(image_path, image_prompt, models,
+                                                            budget_key=prompt_fingerprint(request_prompt))
             
             # 为每个模型的分析结果创建独立的行
             for model_name, analysis_result in model_analysis_pairs:
-                print(f"    正在翻译 {model_name} 的分析结果...")
-                english_translation = translate_to_english(analysis_result)
+                if str(analysis_result).startswith("分析失败"):
+                    english_translation = 'Analysis failed'
+                elif bilingual:
+                    analysis_result, english_translation = split_bilingual_result(analysis_result)
+                else:
+                    print(f"    正在翻译 {model_name} 的分析结果...")
+                    english_translation = translate_to_english(analysis_result)
                 
                 results.append({
                     '图片名': os.path.basename(image_path),
@@ -305,24 +644,46 @@ def analyze_images_to_excel(image_dir=None, prompt=None, output_file=None, model
                 '分析内容': error_msg,
                 '英文prompt': 'Analysis failed'
             })
+        
+        # 更新进度（批量分析的图片已在分析时计入）
+        image_rows = results[first_row:]
+        succeeded_rows = [row for row in image_rows
+                          if row['模型名'] != '分析失败' and not str(row['分析内容']).startswith('分析失败')]
+        if batched_pairs is None:
+            tracker.image_done([row['模型名'] for row in succeeded_rows])
+            print_progress()
+        
+        # 复制结果给近似重复的图片
+        for duplicate_path in duplicates.get(image_path, []):
+            print(f"  近似重复图片 {os.path.basename(duplicate_path)} 复用以上结果")
+            for row in image_rows:
+                results.append(dict(row, 图片名=os.path.basename(duplicate_path)))
+        
+        # 成功的结果（包括复用给近似重复图片的）追加到历史结果存储
+        if succeeded_rows:
+            for path in [image_path] + duplicates.get(image_path, []):
+                image_hash = file_sha256(path)
+                archive_records.extend(result_to_record(dict(row, 图片名=os.path.basename(path)), image_hash, prompt)
+                                       for row in succeeded_rows)
+    
+    get_latency_stats().save()
+    get_token_budget().save()
+    archive_results(archive_records)
     
     # 保存结果到Excel
     try:
-        df = pd.DataFrame(results)
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            print("警告: 未安装openpyxl库，Excel功能可能无法正常使用。请运行: pip install openpyxl")
+            raise
+        from result_export import write_xlsx
         
         # 确保输出目录存在
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
         
-        # 保存到Excel文件
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='图片分析结果', index=False)
-            
-            # 调整列宽
-            worksheet = writer.sheets['图片分析结果']
-            worksheet.column_dimensions['A'].width = 30  # 图片名列
-            worksheet.column_dimensions['B'].width = 20  # 模型名列
-            worksheet.column_dimensions['C'].width = 80  # 分析内容列
-            worksheet.column_dimensions['D'].width = 80  # 英文prompt列
+        # 逐行写出Excel文件（图片名、模型名、分析内容、英文prompt）
+        write_xlsx(results, output_file, sheet_name='图片分析结果', column_widths=[30, 20, 80, 80])
         
         print("="*60)
         print(f"分析完成！结果已保存到: {output_file}")
@@ -338,6 +699,23 @@ def analyze_images_to_excel(image_dir=None, prompt=None, output_file=None, model
         print(error_msg)
         return None
 
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="批量分析目录下的图片，并将多个模型的分析结果保存到Excel文件"
+    )
+    parser.add_argument("image_dir", nargs="?", default=OPENIMG_DIR, help="图片目录")
+    parser.add_argument("prompt", nargs="?", default=DEFAULT_PROMPT, help="分析提示词")
+    parser.add_argument("output_file", nargs="?", default=None, help="输出Excel文件路径")
+    parser.add_argument("--bilingual", action="store_true",
+                        help="让模型一次返回中文分析和英文prompt，省去单独的翻译请求")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="CASSETTE", help="把所有模型请求和响应录制到文件")
+    cassette.add_argument("--replay", metavar="CASSETTE", help="从录制文件回放响应，不访问网络")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="回放倍速，1为按录制耗时等待，0为不等待（默认1）")
+    return parser.parse_args(argv)
+
 def main():
     """
     主函数 - 可以通过命令行参数或直接调用
@@ -346,22 +724,22 @@ def main():
         python prompt_generate.py [图片目录] [分析提示词] [输出文件]
     """
     # 解析命令行参数
-    image_dir = OPENIMG_DIR
-    prompt = DEFAULT_PROMPT
-    output_file = None
+    args = parse_args()
     
-    if len(sys.argv) > 1:
-        image_dir = sys.argv[1]
-    if len(sys.argv) > 2:
-        prompt = sys.argv[2]
-    if len(sys.argv) > 3:
-        output_file = sys.argv[3]
+    # 录制/回放模式
+    if args.record or args.replay:
+        from replay_transport import configure
+        if args.record:
+            configure("record", args.record)
+        else:
+            configure("replay", args.replay, args.replay_speed)
     
     # 执行分析
     result_file = analyze_images_to_excel(
-        image_dir=image_dir,
-        prompt=prompt,
-        output_file=output_file
+        image_dir=args.image_dir,
+        prompt=args.prompt,
+        output_file=args.output_file,
+        bilingual=args.bilingual
     )
     
     return result_file
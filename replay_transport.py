@@ -0,0 +1,192 @@
+import os
+import re
+import gzip
+import json
+import time
+import base64
+import hashlib
+import threading
+from collections import defaultdict, deque
+
+import httpx
+
+
+# 环境变量配置（命令行参数 --record/--replay 会覆盖）
+CASSETTE_ENV = "PROMPT_CASSETTE"            # 录制文件路径
+CASSETTE_MODE_ENV = "PROMPT_CASSETTE_MODE"  # record 或 replay
+REPLAY_SPEED_ENV = "PROMPT_REPLAY_SPEED"    # 回放倍速，0表示不等待
+
+KEPT_RESPONSE_HEADERS = ("content-type",)
+
+
+class CassetteMissError(Exception):
+    """
+    回放时录制文件中没有对应的请求
+
+    不继承httpx.TransportError：缺少录制不是临时网络错误，重试层（见http_client）不重试，请求立即失败。
+    """
+
+
+# max_tokens按历史输出长度自动调整（见token_budget），不参与请求指纹
+_MAX_TOKENS_RE = re.compile(rb'"max_tokens":\s*\d+,?')
+
+
+def request_key(request):
+    """按方法、路径和请求体计算请求指纹（不含鉴权等请求头，换密钥或代理地址也能回放）"""
+    hasher = hashlib.sha256()
+    hasher.update(request.method.encode("ascii"))
+    hasher.update(b" ")
+    hasher.update(request.url.raw_path)
+    hasher.update(b"\n")
+    hasher.update(_MAX_TOKENS_RE.sub(b"", request.read(), count=1))
+    return hasher.hexdigest()
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """
+    录制请求/响应的传输层
+
+    每个请求记录为录制文件中的一行（gzip压缩的JSON Lines）：请求指纹、状态码、
+    响应体和耗时。请求体只保存指纹，不保存图片数据，录制文件很小。
+    """
+
+    def __init__(self, path, transport=None):
+        self.path = path
+        self.transport = transport or httpx.HTTPTransport()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def handle_request(self, request):
+        key = request_key(request)
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        elapsed = time.perf_counter() - start
+
+        record = {
+            "key": key,
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in KEPT_RESPONSE_HEADERS if name in response.headers},
+            "body": base64.b64encode(content).decode("ascii"),
+            "elapsed": round(elapsed, 4),
+            "recorded_at": time.time()
+        }
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            # 每条记录单独成为一个gzip成员，追加写入不需要重写整个文件
+            with gzip.open(self.path, "ab") as f:
+                f.write(line)
+
+        return httpx.Response(response.status_code, headers=record["headers"], content=content,
+                              request=request, extensions={"elapsed": elapsed})
+
+    def close(self):
+        self.transport.close()
+
+
+def load_cassette(path):
+    """读取录制文件，返回 请求指纹 -> 记录队列"""
+    records = defaultdict(deque)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                records[record["key"]].append(record)
+    return records
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """
+    按录制文件回放响应的传输层，不访问网络
+
+    相同请求按录制顺序依次回放，用完后重复最后一条。speed为回放倍速：
+    1按录制时的耗时等待，10为十倍速，0不等待。
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self._records = load_cassette(path)
+        self._last = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def handle_request(self, request):
+        key = request_key(request)
+        with self._lock:
+            queue = self._records.get(key)
+            if queue:
+                record = queue.popleft()
+                self._last[key] = record
+            else:
+                record = self._last.get(key)
+            if record is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if record is None:
+            raise CassetteMissError(f"录制文件 {self.path} 中没有该请求: {request.method} {request.url.path}")
+        if self.speed > 0:
+            time.sleep(record["elapsed"] / self.speed)
+        return httpx.Response(record["status"], headers=record["headers"],
+                              content=base64.b64decode(record["body"]), request=request,
+                              extensions={"elapsed": record["elapsed"]})
+
+
+_config = {"mode": None, "path": None, "speed": 1.0}
+_config_lock = threading.Lock()
+
+
+def configure(mode=None, path=None, speed=None):
+    """
+    设置录制/回放模式（覆盖环境变量），需在首次创建OpenAI客户端之前调用
+
+    Args:
+        mode: "record"、"replay" 或 None（直连）
+        path: 录制文件路径
+        speed: 回放倍速
+    """
+    if mode not in (None, "record", "replay"):
+        raise ValueError(f"不支持的录制模式: {mode}")
+    with _config_lock:
+        _config["mode"] = mode
+        _config["path"] = path
+        if speed is not None:
+            _config["speed"] = speed
+
+
+def _config_from_env():
+    path = os.environ.get(CASSETTE_ENV)
+    if not path:
+        return None, None, 1.0
+    mode = os.environ.get(CASSETTE_MODE_ENV, "replay" if os.path.exists(path) else "record")
+    speed = float(os.environ.get(REPLAY_SPEED_ENV, "1"))
+    return mode, path, speed
+
+
+def cassette_config():
+    """返回当前的(模式, 录制文件路径, 回放倍速)，configure的设置优先于环境变量"""
+    with _config_lock:
+        if _config["mode"] is not None:
+            return _config["mode"], _config["path"], _config["speed"]
+    return _config_from_env()
+
+
+def create_transport(mode, path, speed=1.0):
+    """按录制/回放模式创建传输层，mode为None时直连"""
+    if mode == "record":
+        print(f"录制模式: 请求和响应将记录到 {path}")
+        return RecordingTransport(path)
+    if mode == "replay":
+        print(f"回放模式: 从 {path} 回放响应（{speed}倍速）")
+        return ReplayTransport(path, speed=speed)
+    return httpx.HTTPTransport()
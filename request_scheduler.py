@@ -0,0 +1,203 @@
+import os
+import time
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+# 优先级：数值越小越优先
+PRIORITY_INTERACTIVE = 0  # Web页面上等待结果的用户
+PRIORITY_BULK = 1         # 命令行批量任务
+
+# 环境变量配置，设置PROMPT_SCHEDULER_DB后启用
+SCHEDULER_DB_ENV = "PROMPT_SCHEDULER_DB"
+SCHEDULER_CAPACITY_ENV = "PROMPT_SCHEDULER_CAPACITY"
+SCHEDULER_RESERVE_ENV = "PROMPT_SCHEDULER_RESERVE"
+
+DEFAULT_CAPACITY = 8      # 同时进行的模型请求数上限（所有进程合计）
+DEFAULT_RESERVE = 2       # 为交互请求保留的并发数，批量请求不能占用
+STALE_AFTER = 900         # 超过该秒数仍未释放的占用视为进程已退出
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    priority INTEGER NOT NULL,
+    tenant TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL,
+    granted_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_waiting ON tickets (granted_at, priority, id);
+CREATE INDEX IF NOT EXISTS idx_tickets_tenant ON tickets (tenant, granted_at);
+"""
+
+# 等待中的票据排序：优先级 -> 租户当前占用数（公平） -> 排队先后
+_NEXT_TICKET_SQL = """
+SELECT w.id, w.priority FROM tickets w
+WHERE w.granted_at IS NULL
+ORDER BY w.priority,
+         (SELECT COUNT(*) FROM tickets g WHERE g.tenant = w.tenant AND g.granted_at IS NOT NULL),
+         w.id
+LIMIT 1
+"""
+
+
+def _pid_alive(pid):
+    """检查本机进程是否存在（Windows上os.kill会结束进程，只在POSIX上检查）"""
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RequestScheduler:
+    """
+    基于SQLite的本机请求调度器
+
+    Web进程和命令行批量任务共用同一个数据库文件，所有模型请求先排队领取许可再发出：
+    - 交互请求优先于批量请求，空出的并发总是先给交互请求；
+    - 始终为交互请求保留reserve个并发，批量任务只能使用剩余容量；
+    - 同一优先级内按租户当前占用数轮转，避免单个大任务独占。
+    """
+
+    def __init__(self, db_path, capacity=DEFAULT_CAPACITY, reserve=DEFAULT_RESERVE,
+                 stale_after=STALE_AFTER, poll_interval=0.05):
+        self.db_path = db_path
+        self.capacity = capacity
+        self.reserve = min(reserve, capacity - 1)
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _purge_stale(self, conn, now):
+        conn.execute("DELETE FROM tickets WHERE granted_at IS NOT NULL AND granted_at < ?",
+                     (now - self.stale_after,))
+        for (pid,) in conn.execute("SELECT DISTINCT pid FROM tickets").fetchall():
+            if not _pid_alive(pid):
+                conn.execute("DELETE FROM tickets WHERE pid = ?", (pid,))
+
+    def _try_grant(self, ticket_id):
+        """在一个写事务中尝试为票据授予许可"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._purge_stale(conn, now)
+            active = conn.execute("SELECT COUNT(*) FROM tickets WHERE granted_at IS NOT NULL").fetchone()[0]
+            granted = False
+            if active < self.capacity:
+                head = conn.execute(_NEXT_TICKET_SQL).fetchone()
+                if head and head[0] == ticket_id:
+                    if head[1] == PRIORITY_INTERACTIVE or active < self.capacity - self.reserve:
+                        conn.execute("UPDATE tickets SET granted_at = ? WHERE id = ?", (now, ticket_id))
+                        granted = True
+            conn.execute("COMMIT")
+            return granted
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire(self, priority=PRIORITY_BULK, tenant="default"):
+        """排队并阻塞直到获得许可，返回票据ID"""
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT INTO tickets (priority, tenant, pid, enqueued_at) VALUES (?, ?, ?, ?)",
+            (priority, tenant, os.getpid(), time.time())
+        )
+        ticket_id = cursor.lastrowid
+        delay = self.poll_interval
+        try:
+            while not self._try_grant(ticket_id):
+                time.sleep(delay)
+                delay = min(delay * 1.5, 0.5)
+        except BaseException:
+            conn.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
+            raise
+        return ticket_id
+
+    def release(self, ticket_id):
+        """释放许可"""
+        self._connect().execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_BULK, tenant="default"):
+        """在with块内持有一个许可"""
+        ticket_id = self.acquire(priority, tenant)
+        try:
+            yield ticket_id
+        finally:
+            self.release(ticket_id)
+
+    def stats(self):
+        """返回当前排队和占用情况"""
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT priority, granted_at IS NOT NULL, COUNT(*), COUNT(DISTINCT tenant) "
+            "FROM tickets GROUP BY priority, granted_at IS NOT NULL"
+        ).fetchall()
+        stats = {'capacity': self.capacity, 'reserve': self.reserve, 'classes': {}}
+        names = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BULK: 'bulk'}
+        for priority, granted, count, tenants in rows:
+            entry = stats['classes'].setdefault(names.get(priority, str(priority)),
+                                                {'active': 0, 'waiting': 0, 'tenants': 0})
+            entry['active' if granted else 'waiting'] += count
+            entry['tenants'] = max(entry['tenants'], tenants)
+        return stats
+
+
+# 当前线程/上下文中发出的请求所属的优先级和租户
+_current = contextvars.ContextVar("request_scheduling", default=None)
+
+
+@contextmanager
+def scheduling(priority, tenant):
+    """设置with块内模型请求的优先级和租户"""
+    token = _current.set((priority, tenant))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current_scheduling():
+    """返回当前的(优先级, 租户)，未设置时按批量请求处理，以进程为租户"""
+    return _current.get() or (PRIORITY_BULK, f"pid:{os.getpid()}")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """按环境变量创建全局调度器，未配置时返回None"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            db_path = os.environ.get(SCHEDULER_DB_ENV)
+            if not db_path:
+                return None
+            _scheduler = RequestScheduler(
+                db_path,
+                capacity=int(os.environ.get(SCHEDULER_CAPACITY_ENV, DEFAULT_CAPACITY)),
+                reserve=int(os.environ.get(SCHEDULER_RESERVE_ENV, DEFAULT_RESERVE))
+            )
+        return _scheduler
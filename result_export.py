@@ -0,0 +1,104 @@
+import io
+import csv
+import json
+from tempfile import SpooledTemporaryFile
+
+
+# 导出列：(列名, Excel列宽)
+EXPORT_COLUMNS = [
+    ('图片名', 30),
+    ('模型名', 15),
+    ('分析内容', 50),
+    ('英文prompt', 50)
+]
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8'
+}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def result_to_row(result):
+    """
+    将一条分析结果转换为导出行
+
+    兼容Web端（英文键）和命令行（中文键）两种结果格式。
+    """
+    return (
+        result.get('图片名', result.get('original_filename', result.get('filename', ''))),
+        result.get('模型名', result.get('model', '')),
+        result.get('分析内容', result.get('analysis', '')),
+        result.get('英文prompt', result.get('english_analysis', ''))
+    )
+
+
+def iter_csv(results):
+    """逐行生成CSV内容（带BOM，Excel可直接打开）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for result in results:
+        writer.writerow(result_to_row(result))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_jsonl(results):
+    """逐行生成JSON Lines内容"""
+    names = [name for name, _ in EXPORT_COLUMNS]
+    for result in results:
+        yield json.dumps(dict(zip(names, result_to_row(result))), ensure_ascii=False) + '\n'
+
+
+def write_xlsx(results, target, sheet_name='分析结果', column_widths=None):
+    """
+    用openpyxl只写模式逐行写出Excel，不构建DataFrame
+
+    Args:
+        results: 分析结果列表（或任意可迭代对象）
+        target: 输出路径或可写的二进制文件对象
+        sheet_name: 工作表名称
+        column_widths: 列宽列表，默认使用EXPORT_COLUMNS中的设置
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    if column_widths is None:
+        column_widths = [width for _, width in EXPORT_COLUMNS]
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title=sheet_name)
+    for index, width in enumerate(column_widths, 1):
+        worksheet.column_dimensions[get_column_letter(index)].width = width
+
+    worksheet.append([name for name, _ in EXPORT_COLUMNS])
+    for result in results:
+        worksheet.append(result_to_row(result))
+    workbook.save(target)
+
+
+def iter_xlsx(results, sheet_name='分析结果'):
+    """生成Excel并分块输出（小文件在内存中，大文件落到临时文件）"""
+    with SpooledTemporaryFile(max_size=8 * 1024 * 1024) as buffer:
+        write_xlsx(results, buffer, sheet_name=sheet_name)
+        buffer.seek(0)
+        for chunk in iter(lambda: buffer.read(STREAM_CHUNK_SIZE), b''):
+            yield chunk
+
+
+def iter_export(results, fmt):
+    """按格式生成导出内容"""
+    if fmt == 'csv':
+        return iter_csv(results)
+    if fmt == 'jsonl':
+        return iter_jsonl(results)
+    if fmt == 'xlsx':
+        return iter_xlsx(results)
+    raise ValueError(f"不支持的导出格式: {fmt}")
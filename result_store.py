@@ -0,0 +1,582 @@
+"""
+历史分析结果的列式存储和倒排索引
+
+所有运行（命令行和Web）的分析结果按行追加到同一个存储目录：
+  - 图片哈希、模型名、提示词重复度高，按字典编码为4字节编号（<列名>.col）
+  - 图片名、分析内容、英文prompt为变长文本，数据写入<列名>.dat，
+    每行的结束偏移写入<列名>.idx（8字节）
+  - 分析时间为8字节浮点数（created_at.col）
+  - index.db（SQLite）保存字典、已提交行数和倒排索引：行号按段保存，段内为相邻行号差值的
+    变长整数编码（常见词每行约1字节）；每个词最新的段直接存在词表中，写满后才移入倒排表，
+    以词的整数编号为键，因此只出现过几次的词只占词表中的一行
+
+追加时在同一个SQLite写事务中写列文件和索引，中途中断的追加会在下一次追加时截掉。
+
+用法:
+    python result_store.py search "marble background" [--model gpt-4.1] [--limit 20]
+    python result_store.py stats
+    python result_store.py import 分析结果.xlsx [...]
+    python result_store.py reindex
+"""
+import os
+import re
+import sys
+import time
+import struct
+import sqlite3
+import argparse
+import itertools
+import threading
+
+
+STORE_ENV = "PROMPT_RESULT_STORE"
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_store")
+
+DICT_COLUMNS = ('image_hash', 'model', 'prompt')
+TEXT_COLUMNS = ('image_name', 'analysis', 'english')
+INDEXED_COLUMNS = ('image_name', 'analysis', 'english')
+COLUMNS = DICT_COLUMNS + TEXT_COLUMNS + ('created_at',)
+
+CODE_FORMAT = '<I'      # 字典编号
+OFFSET_FORMAT = '<Q'    # 文本列结束偏移
+TIME_FORMAT = '<d'      # 分析时间
+CODE_WIDTH = struct.calcsize(CODE_FORMAT)
+OFFSET_WIDTH = struct.calcsize(OFFSET_FORMAT)
+TIME_WIDTH = struct.calcsize(TIME_FORMAT)
+
+REINDEX_BATCH = 2000
+SEGMENT_BYTES = 1024    # 词表中的最新段超过该大小后移入倒排表
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dictionary (
+    col TEXT NOT NULL,
+    code INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (col, code)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_dictionary_value ON dictionary (col, value);
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    id INTEGER NOT NULL,
+    df INTEGER NOT NULL,
+    tail_row INTEGER NOT NULL,
+    tail BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    term_id INTEGER NOT NULL,
+    first_row INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (term_id, first_row)
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO meta (key, value) VALUES ('rows', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('next_term_id', 0);
+"""
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:['\-][a-z0-9]+)*|[㐀-鿿豈-﫿]+")
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]")
+
+
+def tokenize(text):
+    """
+    分词：英文和数字按单词（小写），中文按相邻两字切分（单字词保留单字）
+
+    Returns:
+        set: 词集合
+    """
+    terms = set()
+    for word in _WORD_RE.findall((text or '').lower()):
+        if _CJK_RE.match(word):
+            if len(word) == 1:
+                terms.add(word)
+            else:
+                terms.update(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.add(word)
+    return terms
+
+
+def encode_deltas(rows, previous):
+    """把递增的行号编码为与前一行的差值（变长整数，每字节7位）"""
+    out = bytearray()
+    for row in rows:
+        delta = row - previous
+        previous = row
+        while delta >= 0x80:
+            out.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def decode_rows(first_row, data):
+    """解码一个倒排段，返回行号列表（第一行为first_row，其后为data中的差值）"""
+    rows = [first_row]
+    row = first_row
+    delta = shift = 0
+    for byte in data:
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        row += delta
+        rows.append(row)
+        delta = shift = 0
+    return rows
+
+
+def result_to_record(result, image_hash='', prompt='', created_at=None):
+    """
+    将一条分析结果（Web端英文键或命令行中文键）转换为存储行
+
+    Args:
+        result: 分析结果dict
+        image_hash: 图片内容SHA-256
+        prompt: 使用的提示词
+        created_at: 分析时间戳，默认当前时间
+    """
+    return {
+        'image_hash': image_hash or '',
+        'image_name': result.get('图片名', result.get('original_filename', result.get('filename', ''))),
+        'model': result.get('模型名', result.get('model', '')),
+        'prompt': prompt or '',
+        'analysis': result.get('分析内容', result.get('analysis', '')) or '',
+        'english': result.get('英文prompt', result.get('english_analysis', '')) or '',
+        'created_at': created_at if created_at is not None else time.time()
+    }
+
+
+class ResultStore:
+    """
+    追加写入的列式结果存储，带增量更新的倒排索引
+
+    多个进程可以同时追加和查询：追加在SQLite写事务（BEGIN IMMEDIATE）中进行，
+    查询只读取已提交的行。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._dict_lock = threading.Lock()
+        self._codes = {col: {} for col in DICT_COLUMNS}   # 值 -> 编号
+        self._values = {col: {} for col in DICT_COLUMNS}  # 编号 -> 值
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, 'index.db'), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _path(self, column, suffix):
+        return os.path.join(self.directory, f"{column}.{suffix}")
+
+    def row_count(self):
+        """已提交的行数"""
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'rows'").fetchone()[0]
+
+    # ---- 写入 ----
+
+    def _truncate_uncommitted(self, rows):
+        """截掉上一次中断的追加留下的未提交数据"""
+        for col in DICT_COLUMNS:
+            self._truncate(self._path(col, 'col'), rows * CODE_WIDTH)
+        self._truncate(self._path('created_at', 'col'), rows * TIME_WIDTH)
+        for col in TEXT_COLUMNS:
+            idx_path = self._path(col, 'idx')
+            self._truncate(idx_path, rows * OFFSET_WIDTH)
+            self._truncate(self._path(col, 'dat'), self._text_end(idx_path, rows))
+
+    @staticmethod
+    def _truncate(path, size):
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, 'r+b') as f:
+                f.truncate(size)
+
+    @staticmethod
+    def _text_end(idx_path, rows):
+        """文本列前rows行数据的总长度"""
+        if rows == 0 or not os.path.exists(idx_path):
+            return 0
+        with open(idx_path, 'rb') as f:
+            f.seek((rows - 1) * OFFSET_WIDTH)
+            return struct.unpack(OFFSET_FORMAT, f.read(OFFSET_WIDTH))[0]
+
+    def _encode(self, conn, col, value, pending):
+        """字典编码，新值在当前事务中写入字典表"""
+        code = self._codes[col].get(value)
+        if code is None:
+            code = pending.get((col, value))
+        if code is None:
+            row = conn.execute("SELECT code FROM dictionary WHERE col = ? AND value = ?", (col, value)).fetchone()
+            if row:
+                code = row[0]
+            else:
+                code = conn.execute("SELECT COUNT(*) FROM dictionary WHERE col = ?", (col,)).fetchone()[0]
+                conn.execute("INSERT INTO dictionary (col, code, value) VALUES (?, ?, ?)", (col, code, value))
+            pending[(col, value)] = code
+        return code
+
+    def append(self, records):
+        """
+        追加多行并更新倒排索引
+
+        Args:
+            records: 存储行列表（见result_to_record）
+
+        Returns:
+            int: 追加后的总行数
+        """
+        records = list(records)
+        if not records:
+            return self.row_count()
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT value FROM meta WHERE key = 'rows'").fetchone()[0]
+            self._truncate_uncommitted(rows)
+            pending = {}
+
+            codes = {col: [self._encode(conn, col, str(r.get(col) or ''), pending) for r in records]
+                     for col in DICT_COLUMNS}
+            for col in DICT_COLUMNS:
+                with open(self._path(col, 'col'), 'ab') as f:
+                    f.write(struct.pack(f"<{len(records)}I", *codes[col]))
+            with open(self._path('created_at', 'col'), 'ab') as f:
+                f.write(struct.pack(f"<{len(records)}d", *(float(r.get('created_at') or time.time()) for r in records)))
+            for col in TEXT_COLUMNS:
+                end = self._text_end(self._path(col, 'idx'), rows)
+                data = [str(r.get(col) or '').encode('utf-8') for r in records]
+                offsets = []
+                for value in data:
+                    end += len(value)
+                    offsets.append(end)
+                with open(self._path(col, 'dat'), 'ab') as f:
+                    f.write(b''.join(data))
+                with open(self._path(col, 'idx'), 'ab') as f:
+                    f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+
+            self._index_rows(conn, rows, records)
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'rows'", (rows + len(records),))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        # 事务提交后才把新编号放入内存缓存
+        with self._dict_lock:
+            for (col, value), code in pending.items():
+                self._codes[col][value] = code
+                self._values[col][code] = value
+        return rows + len(records)
+
+    @staticmethod
+    def _index_rows(conn, first_row, records):
+        """
+        为从first_row开始的各行写入倒排索引
+
+        新行号接在词表中该词最新的段之后；该段已超过SEGMENT_BYTES时先移入倒排表，再另起一段。
+        """
+        rows_by_term = {}
+        for offset, record in enumerate(records):
+            terms = set()
+            for col in INDEXED_COLUMNS:
+                terms |= tokenize(record.get(col))
+            for term in terms:
+                rows_by_term.setdefault(term, []).append(first_row + offset)
+
+        next_id = conn.execute("SELECT value FROM meta WHERE key = 'next_term_id'").fetchone()[0]
+        for term, rows in rows_by_term.items():
+            found = conn.execute("SELECT id, tail_row, tail FROM terms WHERE term = ?", (term,)).fetchone()
+            if found is None:
+                conn.execute("INSERT INTO terms (term, id, df, tail_row, tail) VALUES (?, ?, ?, ?, ?)",
+                             (term, next_id, len(rows), rows[0], encode_deltas(rows[1:], rows[0])))
+                next_id += 1
+                continue
+            term_id, tail_row, tail = found
+            if len(tail) >= SEGMENT_BYTES:
+                conn.execute("INSERT INTO postings (term_id, first_row, data) VALUES (?, ?, ?)",
+                             (term_id, tail_row, tail))
+                tail_row, tail = rows[0], encode_deltas(rows[1:], rows[0])
+            else:
+                tail += encode_deltas(rows, decode_rows(tail_row, tail)[-1])
+            conn.execute("UPDATE terms SET df = df + ?, tail_row = ?, tail = ? WHERE term = ?",
+                         (len(rows), tail_row, tail, term))
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'next_term_id'", (next_id,))
+
+    def reindex(self):
+        """根据列文件重建倒排索引"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT value FROM meta WHERE key = 'rows'").fetchone()[0]
+            conn.execute("DELETE FROM postings")
+            conn.execute("DELETE FROM terms")
+            conn.execute("UPDATE meta SET value = 0 WHERE key = 'next_term_id'")
+            for start in range(0, rows, REINDEX_BATCH):
+                batch = range(start, min(start + REINDEX_BATCH, rows))
+                batch_rows = self.get_rows(batch, INDEXED_COLUMNS)
+                self._index_rows(conn, start, [batch_rows[row] for row in batch])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    # ---- 读取 ----
+
+    def _decode(self, col, code):
+        value = self._values[col].get(code)
+        if value is None:
+            row = self._connect().execute(
+                "SELECT value FROM dictionary WHERE col = ? AND code = ?", (col, code)).fetchone()
+            value = row[0] if row else ''
+            with self._dict_lock:
+                self._values[col][code] = value
+        return value
+
+    def get_rows(self, row_ids, columns=COLUMNS):
+        """
+        按行号读取指定列
+
+        Returns:
+            dict: 行号 -> 存储行
+        """
+        row_ids = sorted(set(row_ids))
+        records = {row: {'row': row} for row in row_ids}
+        for col in columns:
+            if col in DICT_COLUMNS or col == 'created_at':
+                fmt, width = (CODE_FORMAT, CODE_WIDTH) if col in DICT_COLUMNS else (TIME_FORMAT, TIME_WIDTH)
+                with open(self._path(col, 'col'), 'rb') as f:
+                    for row in row_ids:
+                        f.seek(row * width)
+                        value = struct.unpack(fmt, f.read(width))[0]
+                        records[row][col] = self._decode(col, value) if col in DICT_COLUMNS else value
+            else:
+                with open(self._path(col, 'idx'), 'rb') as idx, open(self._path(col, 'dat'), 'rb') as dat:
+                    for row in row_ids:
+                        if row == 0:
+                            idx.seek(0)
+                            start, end = 0, struct.unpack(OFFSET_FORMAT, idx.read(OFFSET_WIDTH))[0]
+                        else:
+                            idx.seek((row - 1) * OFFSET_WIDTH)
+                            start, end = struct.unpack('<2Q', idx.read(2 * OFFSET_WIDTH))
+                        dat.seek(start)
+                        records[row][col] = dat.read(end - start).decode('utf-8')
+        return records
+
+    def search(self, query, model=None, limit=50):
+        """
+        搜索历史结果：所有查询词都出现的行，按时间倒序
+
+        先按文档频率最低的词从新到旧遍历它的段，其余词逐行查找包含该行的段确认，
+        找够limit条即停止，不需要求出完整的交集。中文词按两字切分后可能误匹配，
+        因此最后再核对原文包含每个查询词。
+
+        Args:
+            query: 查询文本（空格分隔多个词）
+            model: 只返回该模型的结果
+            limit: 最多返回条数
+
+        Returns:
+            list: 存储行列表（含row行号）
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        words = _WORD_RE.findall(query.lower())
+
+        conn = self._connect()
+        committed = self.row_count()
+        frequencies = []
+        for term in terms:
+            row = conn.execute("SELECT df, id, tail_row, tail FROM terms WHERE term = ?", (term,)).fetchone()
+            if not row:
+                return []
+            frequencies.append(row)
+        frequencies.sort()
+        _, rarest, rarest_tail_row, rarest_tail = frequencies[0]
+        others = [(term_id, tail_row, tail) for _, term_id, tail_row, tail in frequencies[1:]]
+        segments = {}  # 词编号 -> 最近解码的段 (首行, 末行, 行号集合)
+
+        model_code = None
+        if model is not None:
+            model_code = self._codes['model'].get(model)
+            if model_code is None:
+                row = conn.execute("SELECT code FROM dictionary WHERE col = 'model' AND value = ?", (model,)).fetchone()
+                if not row:
+                    return []
+                model_code = row[0]
+
+        results = []
+        cursor = conn.execute("SELECT first_row, data FROM postings WHERE term_id = ? AND first_row < ? "
+                              "ORDER BY first_row DESC", (rarest, committed))
+        model_file = open(self._path('model', 'col'), 'rb') if model_code is not None else None
+        try:
+            for first_row, data in itertools.chain([(rarest_tail_row, rarest_tail)], cursor):
+                for row_id in reversed(decode_rows(first_row, data)):
+                    if row_id >= committed:
+                        continue
+                    if model_file is not None:
+                        model_file.seek(row_id * CODE_WIDTH)
+                        if struct.unpack(CODE_FORMAT, model_file.read(CODE_WIDTH))[0] != model_code:
+                            continue
+                    if not all(self._has_posting(conn, term, row_id, segments) for term in others):
+                        continue
+                    record = self.get_rows([row_id])[row_id]
+                    text = ' '.join(record[col] for col in INDEXED_COLUMNS).lower()
+                    if all(word in text for word in words):
+                        results.append(record)
+                        if len(results) >= limit:
+                            return results
+        finally:
+            cursor.close()
+            if model_file is not None:
+                model_file.close()
+        return results
+
+    @staticmethod
+    def _has_posting(conn, term, row_id, segments):
+        """
+        判断词是否出现在该行（按行号找到所在的段，解码结果缓存在segments中）
+
+        Args:
+            term: (词编号, 最新段首行, 最新段数据)
+        """
+        term_id, tail_row, tail = term
+        segment = segments.get(term_id)
+        if segment is None or not segment[0] <= row_id <= segment[1]:
+            if row_id >= tail_row:
+                found = (tail_row, tail)
+            else:
+                found = conn.execute(
+                    "SELECT first_row, data FROM postings WHERE term_id = ? AND first_row <= ? "
+                    "ORDER BY first_row DESC LIMIT 1", (term_id, row_id)).fetchone()
+            if found is None:
+                return False
+            rows = decode_rows(found[0], found[1])
+            segment = (rows[0], rows[-1], set(rows))
+            segments[term_id] = segment
+        return row_id in segment[2]
+
+    def stats(self):
+        """返回存储统计信息"""
+        conn = self._connect()
+        size = sum(os.path.getsize(os.path.join(self.directory, name))
+                   for name in os.listdir(self.directory)
+                   if os.path.isfile(os.path.join(self.directory, name)))
+        return {
+            'rows': self.row_count(),
+            'terms': conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0],
+            'models': conn.execute("SELECT COUNT(*) FROM dictionary WHERE col = 'model'").fetchone()[0],
+            'images': conn.execute("SELECT COUNT(*) FROM dictionary WHERE col = 'image_hash'").fetchone()[0],
+            'prompts': conn.execute("SELECT COUNT(*) FROM dictionary WHERE col = 'prompt'").fetchone()[0],
+            'size_bytes': size
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """返回全局结果存储（目录可通过PROMPT_RESULT_STORE设置）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultStore(os.environ.get(STORE_ENV, DEFAULT_STORE_DIR))
+        return _store
+
+
+def archive_results(records):
+    """把分析结果追加到历史存储，失败时只打印提示，不影响分析流程"""
+    try:
+        get_result_store().append(records)
+    except Exception as e:
+        print(f"写入历史结果存储失败: {str(e)}")
+
+
+def import_workbook(store, path):
+    """导入以前生成的Excel结果文件（没有图片哈希和提示词）"""
+    from openpyxl import load_workbook
+    from result_export import EXPORT_COLUMNS
+
+    names = [name for name, _ in EXPORT_COLUMNS]
+    created_at = os.path.getmtime(path)
+    workbook = load_workbook(path, read_only=True)
+    try:
+        records = []
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = [str(cell) if cell is not None else '' for cell in next(rows, ())]
+            if not set(names) <= set(header):
+                continue
+            positions = [header.index(name) for name in names]
+            for values in rows:
+                result = {name: values[pos] if pos < len(values) and values[pos] is not None else ''
+                          for name, pos in zip(names, positions)}
+                if result['模型名'] and not str(result['分析内容']).startswith('分析失败'):
+                    records.append(result_to_record({k: str(v) for k, v in result.items()}, created_at=created_at))
+    finally:
+        workbook.close()
+    store.append(records)
+    return len(records)
+
+
+def _print_record(record):
+    created = time.strftime('%Y-%m-%d %H:%M', time.localtime(record['created_at']))
+    print(f"#{record['row']}  {created}  {record['image_name']}  [{record['model']}]")
+    if record['image_hash']:
+        print(f"  sha256: {record['image_hash']}")
+    print(f"  {record['english'][:200]}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史分析结果的存储与搜索")
+    parser.add_argument("--store", default=None, help=f"存储目录（默认: 环境变量{STORE_ENV}或 {DEFAULT_STORE_DIR}）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = subparsers.add_parser("search", help="搜索分析内容、英文prompt和图片名")
+    search_parser.add_argument("query", help="查询词，多个词之间用空格分隔（需全部出现）")
+    search_parser.add_argument("--model", default=None, help="只搜索该模型的结果")
+    search_parser.add_argument("--limit", type=int, default=20, help="最多返回条数（默认: 20）")
+
+    subparsers.add_parser("stats", help="显示存储统计信息")
+
+    import_parser = subparsers.add_parser("import", help="导入以前生成的Excel结果文件")
+    import_parser.add_argument("files", nargs="+", help="Excel文件路径")
+
+    subparsers.add_parser("reindex", help="重建倒排索引")
+
+    args = parser.parse_args()
+    store = ResultStore(args.store) if args.store else get_result_store()
+
+    if args.command == "search":
+        start = time.perf_counter()
+        records = store.search(args.query, model=args.model, limit=args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for record in records:
+            _print_record(record)
+        print(f"共 {len(records)} 条结果（{elapsed:.1f}ms）")
+    elif args.command == "stats":
+        for key, value in store.stats().items():
+            print(f"{key}: {value}")
+    elif args.command == "import":
+        for path in args.files:
+            print(f"{path}: 导入 {import_workbook(store, path)} 行")
+    elif args.command == "reindex":
+        print(f"已重建 {store.reindex()} 行的索引")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
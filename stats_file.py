@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import threading
+
+
+SAVE_INTERVAL = 5.0        # 最多每5秒写一次统计文件
+
+
+class JsonStatsFile:
+    """
+    持久化到JSON文件的统计基类
+
+    子类实现_restore（从文件数据恢复）和_snapshot（在锁内生成要写入的数据），
+    修改统计后在锁内调用_mark_dirty，返回True时在锁外调用save。
+    写入先写临时文件再替换，距上次写入不足SAVE_INTERVAL秒时只标记待写。
+    """
+
+    name = "统计"           # 保存失败时提示的统计名称
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._restore(data)
+
+    def _restore(self, data):
+        raise NotImplementedError
+
+    def _snapshot(self):
+        raise NotImplementedError
+
+    def _mark_dirty(self):
+        """标记有未写入的修改（调用方持有锁），返回是否应立即写入"""
+        self._dirty = True
+        return time.time() - self._last_save >= SAVE_INTERVAL
+
+    def save(self):
+        """写入统计文件（先写临时文件再替换）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = self._snapshot()
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"保存{self.name}失败: {str(e)}")
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def shared_instance(cls, path_env, default_path):
+    """返回cls的全局实例，首次调用时创建（路径取环境变量path_env，未设置时用default_path）"""
+    with _instances_lock:
+        if cls not in _instances:
+            _instances[cls] = cls(os.environ.get(path_env, default_path))
+        return _instances[cls]
@@ -0,0 +1,83 @@
+import os
+import hmac
+import json
+import time
+import hashlib
+from urllib.parse import urlparse
+
+
+CALLBACK_SECRET_ENV = "PROMPT_CALLBACK_SECRET"  # 设置后回调请求带HMAC签名
+CALLBACK_RETRIES = 5        # 最多尝试次数
+CALLBACK_BACKOFF = 2.0      # 首次重试等待秒数，之后每次翻倍
+CALLBACK_MAX_BACKOFF = 60.0
+CALLBACK_TIMEOUT = 10       # 单次请求超时（秒）
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def validate_callback_url(url):
+    """检查回调地址，合法时返回None，否则返回错误信息"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+        return f'Invalid callback_url: {url}'
+    return None
+
+
+def sign_payload(body, secret):
+    """计算回调请求体的HMAC-SHA256签名"""
+    return hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def deliver_callback(url, payload, task_id=None, retries=CALLBACK_RETRIES, backoff=CALLBACK_BACKOFF,
+                     timeout=CALLBACK_TIMEOUT, secret=None):
+    """
+    将任务结果以JSON POST到回调地址，失败时按指数退避重试
+
+    连接错误、超时和5xx/429等临时错误会重试，其余4xx视为对方拒收，不再重试。
+
+    Args:
+        url: 回调地址
+        payload: 回调内容（可JSON序列化的dict）
+        task_id: 任务ID，放在X-Task-Id请求头中
+        retries: 最多尝试次数
+        backoff: 首次重试等待秒数
+        timeout: 单次请求超时
+        secret: 签名密钥，默认读取环境变量PROMPT_CALLBACK_SECRET
+
+    Returns:
+        dict: 投递结果 {'status': 'delivered'/'failed', 'attempts', 'status_code', 'error'}
+    """
+    import requests
+
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+    headers = {'Content-Type': 'application/json; charset=utf-8'}
+    if task_id:
+        headers['X-Task-Id'] = task_id
+    secret = secret if secret is not None else os.environ.get(CALLBACK_SECRET_ENV)
+    if secret:
+        headers['X-Signature'] = f"sha256={sign_payload(body, secret)}"
+
+    outcome = {'status': 'failed', 'attempts': 0, 'status_code': None, 'error': None}
+    delay = backoff
+    for attempt in range(1, retries + 1):
+        outcome['attempts'] = attempt
+        headers['X-Callback-Attempt'] = str(attempt)
+        try:
+            response = requests.post(url, data=body, headers=headers, timeout=timeout)
+            outcome['status_code'] = response.status_code
+            if response.status_code < 300:
+                outcome['status'] = 'delivered'
+                outcome['error'] = None
+                return outcome
+            outcome['error'] = f'HTTP {response.status_code}'
+            if response.status_code not in RETRY_STATUS_CODES:
+                break
+        except requests.RequestException as e:
+            outcome['error'] = str(e)
+
+        if attempt < retries:
+            print(f"回调 {url} 第{attempt}次失败（{outcome['error']}），{delay:.0f}秒后重试")
+            time.sleep(delay)
+            delay = min(delay * 2, CALLBACK_MAX_BACKOFF)
+
+    print(f"回调 {url} 失败: {outcome['error']}")
+    return outcome
@@ -0,0 +1,139 @@
+import os
+import gzip
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+class TaskStore:
+    """
+    有容量和时长上限的任务状态表
+
+    用法与dict相同。已结束（completed/failed）的任务按LRU顺序被逐出内存，
+    结果写入压缩的磁盘文件；之后访问 /result 或 /download 时再按需加载回来。
+    进行中的任务始终保留在内存中。
+    """
+
+    def __init__(self, spill_dir, max_tasks=200, max_age=1800, on_spill=None):
+        """
+        Args:
+            spill_dir: 逐出任务的存放目录
+            max_tasks: 内存中最多保留的任务数
+            max_age: 已结束任务在内存中最多保留的秒数
+            on_spill: 任务写盘后的回调，参数为文件路径
+        """
+        self.spill_dir = spill_dir
+        self.max_tasks = max_tasks
+        self.max_age = max_age
+        self.on_spill = on_spill
+        self._tasks = OrderedDict()   # task_id -> 任务状态，末尾为最近使用
+        self._touched = {}            # task_id -> 最近访问时间
+        self._lock = threading.RLock()
+        self._spilled = 0
+        self._reloaded = 0
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, task_id):
+        return os.path.join(self.spill_dir, f"{task_id}.json.gz")
+
+    def _touch(self, task_id):
+        self._tasks.move_to_end(task_id)
+        self._touched[task_id] = time.time()
+
+    def __setitem__(self, task_id, task):
+        with self._lock:
+            self._tasks[task_id] = task
+            self._touch(task_id)
+            self._evict()
+
+    def __getitem__(self, task_id):
+        with self._lock:
+            if task_id not in self._tasks:
+                task = self._load(task_id)
+                if task is None:
+                    raise KeyError(task_id)
+                self._tasks[task_id] = task
+                self._reloaded += 1
+            self._touch(task_id)
+            self._evict(keep=task_id)
+            return self._tasks[task_id]
+
+    def __contains__(self, task_id):
+        with self._lock:
+            return task_id in self._tasks or os.path.exists(self._spill_path(task_id))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tasks)
+
+    def get(self, task_id, default=None):
+        try:
+            return self[task_id]
+        except KeyError:
+            return default
+
+    def _evict(self, keep=None):
+        """逐出超出容量或超过时长的已结束任务"""
+        now = time.time()
+        for task_id in list(self._tasks):
+            if task_id == keep:
+                continue
+            task = self._tasks[task_id]
+            if task.get('status') not in FINISHED_STATUSES:
+                continue
+            too_many = len(self._tasks) > self.max_tasks
+            too_old = now - self._touched.get(task_id, now) > self.max_age
+            if too_many or too_old:
+                self._spill(task_id, task)
+
+    def _spill(self, task_id, task):
+        path = self._spill_path(task_id)
+        try:
+            data = dict(task)
+            if isinstance(data.get('start_time'), datetime):
+                data['start_time'] = data['start_time'].isoformat()
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'), default=str)
+        except Exception as e:
+            print(f"任务 {task_id} 写盘失败，保留在内存中: {str(e)}")
+            return
+        del self._tasks[task_id]
+        self._touched.pop(task_id, None)
+        self._spilled += 1
+        if self.on_spill:
+            self.on_spill(path)
+
+    def _load(self, task_id):
+        path = self._spill_path(task_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                task = json.load(f)
+        except Exception as e:
+            print(f"读取任务 {task_id} 失败: {str(e)}")
+            return None
+        if task.get('start_time'):
+            try:
+                task['start_time'] = datetime.fromisoformat(task['start_time'])
+            except (TypeError, ValueError):
+                pass
+        return task
+
+    def stats(self):
+        """返回任务表统计"""
+        with self._lock:
+            running = sum(1 for t in self._tasks.values() if t.get('status') not in FINISHED_STATUSES)
+            return {
+                'in_memory': len(self._tasks),
+                'running': running,
+                'spilled': self._spilled,
+                'reloaded': self._reloaded,
+                'max_tasks': self.max_tasks,
+                'max_age': self.max_age
+            }
@@ -0,0 +1,158 @@
+import os
+import math
+import hashlib
+from collections import deque
+
+from stats_file import JsonStatsFile, shared_instance
+
+
+BUDGET_FILE_ENV = "PROMPT_TOKEN_BUDGET_FILE"
+ADAPTIVE_ENV = "PROMPT_ADAPTIVE_MAX_TOKENS"  # 设为0时始终使用默认max_tokens
+DEFAULT_BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "token_budget.json")
+
+WINDOW_SIZE = 100          # 每个键保留最近100次请求
+MIN_SAMPLES = 10           # 样本不足时使用模型级统计或默认值
+PERCENTILE = 0.95
+HEADROOM = 1.25            # 在P95输出长度上留出的余量
+TRUNCATION_TARGET = 0.02   # 截断率超过2%时提高上限
+TRUNCATION_BOOST = 1.5     # 被截断请求所用上限的放大倍数
+MIN_MAX_TOKENS = 256
+ROUND_TO = 64
+MODEL_WIDE = "*"           # 模型级统计（不区分提示词）的提示词键
+
+
+def prompt_fingerprint(prompt):
+    """提示词指纹，用作统计键的一部分"""
+    return hashlib.sha1((prompt or '').encode('utf-8')).hexdigest()[:12]
+
+
+class TokenBudget(JsonStatsFile):
+    """
+    按模型和提示词统计实际输出token数，给出下一次请求的max_tokens
+
+    每次请求记录输出token数、是否因长度截断（finish_reason为length）以及当时的max_tokens。
+    max_tokens = P95输出长度 × 1.25；截断率超过目标时，至少取被截断请求上限的1.5倍。
+    输出长度与输入长度相关的请求（例如翻译）按每单位输入的输出token数统计，
+    调用时传入scale（输入长度）换算，这类统计不计入模型级统计。
+    """
+
+    name = "token统计"
+
+    def __init__(self, path):
+        self._entries = {}
+        super().__init__(path)
+
+    def _restore(self, data):
+        for key, entry in data.get('entries', {}).items():
+            self._entries[key] = self._new_entry()
+            self._entries[key]['samples'].extend(tuple(sample) for sample in entry.get('samples', []))
+            self._entries[key]['prompt_tokens'] = entry.get('prompt_tokens', 0)
+            self._entries[key]['requests'] = entry.get('requests', 0)
+
+    @staticmethod
+    def _new_entry():
+        # samples: (每单位输入的输出token数, 是否截断, 每单位输入的max_tokens)
+        return {'samples': deque(maxlen=WINDOW_SIZE), 'prompt_tokens': 0, 'requests': 0}
+
+    @staticmethod
+    def _key(model, prompt_key):
+        return f"{model}|{prompt_key}"
+
+    def _keys(self, model, prompt_key, scale):
+        if scale is None:
+            return [self._key(model, prompt_key), self._key(model, MODEL_WIDE)]
+        return [self._key(model, prompt_key)]
+
+    def record(self, model, prompt_key, completion_tokens, truncated, max_tokens, prompt_tokens=0, scale=None):
+        """记录一次请求的输出长度"""
+        unit = max(scale or 1, 1)
+        sample = (round(completion_tokens / unit, 4), bool(truncated), round(max_tokens / unit, 4))
+        with self._lock:
+            for key in self._keys(model, prompt_key, scale):
+                entry = self._entries.setdefault(key, self._new_entry())
+                entry['samples'].append(sample)
+                entry['prompt_tokens'] += prompt_tokens
+                entry['requests'] += 1
+            should_save = self._mark_dirty()
+        if should_save:
+            self.save()
+
+    def record_response(self, model, prompt_key, response, max_tokens, scale=None):
+        """从ChatCompletion响应中读取usage和finish_reason并记录，返回是否被截断"""
+        usage = getattr(response, 'usage', None)
+        choices = getattr(response, 'choices', None) or []
+        truncated = bool(choices) and getattr(choices[0], 'finish_reason', None) == 'length'
+        if usage is not None and usage.completion_tokens is not None:
+            self.record(model, prompt_key, usage.completion_tokens, truncated, max_tokens,
+                        prompt_tokens=usage.prompt_tokens or 0, scale=scale)
+        return truncated
+
+    @staticmethod
+    def _limit(samples):
+        """按样本计算每单位输入的上限"""
+        lengths = sorted(sample[0] for sample in samples)
+        p95 = lengths[min(int(math.ceil(len(lengths) * PERCENTILE)) - 1, len(lengths) - 1)]
+        limit = p95 * HEADROOM
+        truncated = [sample[2] for sample in samples if sample[1]]
+        if truncated and len(truncated) / len(samples) > TRUNCATION_TARGET:
+            limit = max(limit, max(truncated) * TRUNCATION_BOOST)
+        return limit
+
+    def max_tokens(self, model, prompt_key, default, ceiling, scale=None):
+        """
+        返回本次请求使用的max_tokens
+
+        Args:
+            model: 模型名称
+            prompt_key: 提示词键（prompt_fingerprint或固定名称）
+            default: 没有足够统计数据时使用的值
+            ceiling: 上限
+            scale: 输入长度（按输入长度统计的请求），None表示按绝对长度统计
+
+        Returns:
+            int: max_tokens
+        """
+        if os.environ.get(ADAPTIVE_ENV, '1') == '0':
+            return default
+        with self._lock:
+            samples = None
+            for key in self._keys(model, prompt_key, scale):
+                entry = self._entries.get(key)
+                if entry and len(entry['samples']) >= MIN_SAMPLES:
+                    samples = list(entry['samples'])
+                    break
+        if samples is None:
+            return default
+        limit = self._limit(samples) * max(scale or 1, 1)
+        limit = int(math.ceil(limit / ROUND_TO) * ROUND_TO)
+        return max(MIN_MAX_TOKENS, min(limit, ceiling))
+
+    def summary(self):
+        """返回各模型/提示词的输出长度统计"""
+        with self._lock:
+            summary = {}
+            for key, entry in self._entries.items():
+                samples = list(entry['samples'])
+                if not samples:
+                    continue
+                lengths = sorted(sample[0] for sample in samples)
+                summary[key] = {
+                    'requests': entry['requests'],
+                    'p50': lengths[len(lengths) // 2],
+                    'p95': lengths[min(int(math.ceil(len(lengths) * PERCENTILE)) - 1, len(lengths) - 1)],
+                    'truncation_rate': round(sum(1 for sample in samples if sample[1]) / len(samples), 3),
+                    'avg_prompt_tokens': round(entry['prompt_tokens'] / entry['requests'], 1) if entry['requests'] else None
+                }
+            return summary
+
+    def _snapshot(self):
+        return {'entries': {
+            key: {'samples': [list(sample) for sample in entry['samples']],
+                  'prompt_tokens': entry['prompt_tokens'], 'requests': entry['requests']}
+            for key, entry in self._entries.items()
+        }}
+
+
+def get_token_budget():
+    """返回全局token统计（路径可通过PROMPT_TOKEN_BUDGET_FILE设置）"""
+    return shared_instance(TokenBudget, BUDGET_FILE_ENV, DEFAULT_BUDGET_FILE)
@@ -0,0 +1,179 @@
+import os
+import hashlib
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from werkzeug.utils import secure_filename
+
+
+READ_CHUNK_SIZE = 64 * 1024  # 请求流每次读满该大小才返回
+
+
+def iter_multipart(req, upload_dir, filename_prefix, max_file_size=None, accept=None):
+    """
+    边接收边解析multipart请求体，文件直接写入上传目录
+
+    不经过request.files：每个文件在收到最后一个数据块时即完成落盘、哈希和大小统计，
+    调用方可以在请求体还未接收完时就开始处理已到达的文件，也不会把整个上传缓存在内存或临时文件中。
+
+    Args:
+        req: Flask请求对象（不能事先访问过request.form/request.files）
+        upload_dir: 上传目录
+        filename_prefix: 保存文件名前缀，实际文件名为 前缀_序号_原文件名
+        max_file_size: 单个文件大小上限，超过时抛出RequestEntityTooLarge
+        accept: 判断文件名是否接受的函数，不接受的文件不落盘
+
+    Yields:
+        tuple: ('field', 字段名, 值)、('file', 字段名, 文件信息dict) 或 ('skipped', 字段名, 原文件名)
+               文件信息包含filepath, filename, original_name, sha256, size
+    """
+    mimetype, options = parse_options_header(req.headers.get('Content-Type', ''))
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise BadRequest('Expected multipart/form-data')
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=req.max_form_memory_size)
+    stream = req.stream
+    part = None      # 当前的Field或File事件
+    buffer = None    # 普通字段的数据块
+    target = None    # 当前文件: {'file', 'hasher', 'size', 'info'}
+    index = 0
+    eof = False
+
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                if eof:
+                    raise BadRequest('Incomplete multipart body')
+                data = stream.read(READ_CHUNK_SIZE)
+                eof = not data
+                decoder.receive_data(data or None)
+                continue
+            if isinstance(event, Epilogue):
+                break
+
+            if isinstance(event, Field):
+                part, buffer, target = event, [], None
+            elif isinstance(event, File):
+                part, buffer, target = event, None, None
+                if event.filename and (accept is None or accept(event.filename)):
+                    index += 1
+                    filename = f"{filename_prefix}_{index:04d}_{secure_filename(event.filename)}"
+                    filepath = os.path.join(upload_dir, filename)
+                    target = {
+                        'file': open(filepath, 'wb'),
+                        'hasher': hashlib.sha256(),
+                        'size': 0,
+                        'info': {'filepath': filepath, 'filename': filename, 'original_name': event.filename}
+                    }
+            elif isinstance(event, Data):
+                if buffer is not None:
+                    buffer.append(event.data)
+                elif target is not None:
+                    target['size'] += len(event.data)
+                    if max_file_size is not None and target['size'] > max_file_size:
+                        raise RequestEntityTooLarge()
+                    target['hasher'].update(event.data)
+                    target['file'].write(event.data)
+                if event.more_data:
+                    continue
+
+                if isinstance(part, Field):
+                    yield 'field', part.name, b''.join(buffer).decode('utf-8', 'replace')
+                elif target is not None:
+                    target['file'].close()
+                    info = dict(target['info'], sha256=target['hasher'].hexdigest(), size=target['size'])
+                    target = None
+                    yield 'file', part.name, info
+                elif part.filename:
+                    yield 'skipped', part.name, part.filename
+                part = buffer = None
+    finally:
+        # 中途出错时删除未写完的文件
+        if target is not None:
+            target['file'].close()
+            try:
+                os.remove(target['info']['filepath'])
+            except OSError:
+                pass
+
+
+def read_multipart(req, upload_dir, filename_prefix, max_file_size=None, accept=None):
+    """
+    完整读取multipart请求体（文件直接落盘）
+
+    Returns:
+        tuple: (字段MultiDict, 文件信息列表, 未接受的原文件名列表)
+    """
+    fields = MultiDict()
+    files = []
+    skipped = []
+    try:
+        for kind, name, value in iter_multipart(req, upload_dir, filename_prefix, max_file_size, accept):
+            if kind == 'field':
+                fields.add(name, value)
+            elif kind == 'file':
+                files.append(value)
+            else:
+                skipped.append(value)
+    except Exception:
+        for info in files:
+            try:
+                os.remove(info['filepath'])
+            except OSError:
+                pass
+        raise
+    return fields, files, skipped
+
+
+def persist_bytes(data, original_name, upload_dir, filename_prefix):
+    """
+    将内存中的文件内容（例如JSON接口中base64解码后的图片）写入上传目录
+
+    Args:
+        data: 文件内容
+        original_name: 原始文件名
+        upload_dir: 上传目录
+        filename_prefix: 保存文件名前缀
+
+    Returns:
+        dict: 文件信息，字段与iter_multipart中的文件信息相同
+    """
+    filename = f"{filename_prefix}_{secure_filename(original_name)}"
+    filepath = os.path.join(upload_dir, filename)
+    with open(filepath, 'wb') as dst:
+        dst.write(data)
+
+    return {
+        'filepath': filepath,
+        'filename': filename,
+        'original_name': original_name,
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'size': len(data)
+    }
+
+
+def resolve_source_path(path, root):
+    """
+    解析客户端提交的服务器本地路径，只允许root目录下的已有文件
+
+    Args:
+        path: 绝对路径或相对root的路径
+        root: 允许读取的根目录
+
+    Returns:
+        str: 解析后的真实路径
+
+    Raises:
+        ValueError: 路径不在root目录下或文件不存在
+    """
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f'Path outside allowed root: {path}')
+    if not os.path.isfile(resolved):
+        raise ValueError(f'File not found: {path}')
+    return resolved